@@ -0,0 +1,64 @@
+"""
+Compares insert throughput and external_id index size of
+random token_urlsafe(16) string ids and time-ordered BINARY(16) ids.
+
+Usage: python bin/benchmark_external_id.py [rows]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from secrets import token_urlsafe
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from simplecrud.util.id_util import generate_external_id  # noqa: E402
+
+BATCH_SIZE = 1000
+
+
+def run_benchmark(
+    name: str, column_type: str, id_generator: Callable[[], Any], rows: int
+) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, f"{name}.db")
+        connection = sqlite3.connect(db_path)
+        connection.execute(
+            "CREATE TABLE user ("
+            "id INTEGER PRIMARY KEY, "
+            f"external_id {column_type} NOT NULL, "
+            "first_name VARCHAR(50) NOT NULL)"
+        )
+        connection.execute(
+            "CREATE UNIQUE INDEX user_external_id_idx ON user (external_id)"
+        )
+
+        start_time = time.perf_counter()
+        for _ in range(rows // BATCH_SIZE):
+            connection.executemany(
+                "INSERT INTO user (external_id, first_name) VALUES (?, ?)",
+                [(id_generator(), "first") for _ in range(BATCH_SIZE)],
+            )
+            connection.commit()
+        elapsed = time.perf_counter() - start_time
+
+        index_size = connection.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'user_external_id_idx'"
+        ).fetchone()[0]
+        connection.close()
+
+        print(
+            f"{name:>10}: {rows / elapsed:>10.0f} rows/s, "
+            f"index size {index_size / 1024:>8.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"Inserting {rows_count} rows in batches of {BATCH_SIZE}")
+    run_benchmark("urlsafe", "VARCHAR(50)", lambda: token_urlsafe(16), rows_count)
+    run_benchmark("binary", "BINARY(16)", generate_external_id, rows_count)
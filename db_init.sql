@@ -1,8 +1,44 @@
 CREATE TABLE user
 (
     id INTEGER UNSIGNED AUTO_INCREMENT PRIMARY KEY,
-    external_id VARCHAR(50) NOT NULL,
+    external_id BINARY(16) NOT NULL,
     first_name VARCHAR(50) NOT NULL,
     last_name VARCHAR(50) NOT NULL,
-    birthday DATETIME NOT NULL
-);
\ No newline at end of file
+    birthday DATETIME NOT NULL,
+    version INTEGER UNSIGNED NOT NULL DEFAULT 1,
+    UNIQUE INDEX user_external_id_idx (external_id)
+);
+
+CREATE TABLE user_change
+(
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    external_id BINARY(16) NOT NULL,
+    change_type VARCHAR(10) NOT NULL,
+    version INTEGER UNSIGNED NOT NULL,
+    first_name VARCHAR(50) NOT NULL,
+    last_name VARCHAR(50) NOT NULL,
+    birthday DATETIME NOT NULL,
+    created_at DATETIME(6) NOT NULL
+);
+
+CREATE TABLE outbox_relay_offset
+(
+    name VARCHAR(50) PRIMARY KEY,
+    last_id BIGINT UNSIGNED NOT NULL
+);
+
+CREATE TABLE user_stat
+(
+    bucket_type VARCHAR(20) NOT NULL,
+    -- binary: buckets differing only in case or accents, like 'E' and 'É', stay apart
+    bucket VARCHAR(10) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    slot INTEGER UNSIGNED NOT NULL,
+    user_count BIGINT NOT NULL,
+    PRIMARY KEY (bucket_type, bucket, slot)
+);
+
+CREATE TABLE user_stat_reconcile
+(
+    name VARCHAR(50) PRIMARY KEY,
+    reconciled_at DATETIME(6)
+);
@@ -0,0 +1,17 @@
+-- Converts external_id from token_urlsafe(16) strings to BINARY(16).
+-- Legacy ids are base64url encoded 16 bytes, so they are decoded as is
+-- and stay resolvable by the API through their old string form.
+ALTER TABLE user ADD COLUMN external_id_bin BINARY(16) NULL;
+
+UPDATE user
+SET external_id_bin = FROM_BASE64(
+    CONCAT(REPLACE(REPLACE(external_id, '-', '+'), '_', '/'), '==')
+);
+
+ALTER TABLE user
+    DROP COLUMN external_id,
+    RENAME COLUMN external_id_bin TO external_id;
+
+ALTER TABLE user
+    MODIFY external_id BINARY(16) NOT NULL,
+    ADD UNIQUE INDEX user_external_id_idx (external_id);
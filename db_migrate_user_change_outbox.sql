@@ -0,0 +1,18 @@
+-- Adds the user_change outbox and the offsets of the relays publishing it.
+CREATE TABLE user_change
+(
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    external_id BINARY(16) NOT NULL,
+    change_type VARCHAR(10) NOT NULL,
+    version INTEGER UNSIGNED NOT NULL,
+    first_name VARCHAR(50) NOT NULL,
+    last_name VARCHAR(50) NOT NULL,
+    birthday DATETIME NOT NULL,
+    created_at DATETIME(6) NOT NULL
+);
+
+CREATE TABLE outbox_relay_offset
+(
+    name VARCHAR(50) PRIMARY KEY,
+    last_id BIGINT UNSIGNED NOT NULL
+);
@@ -0,0 +1,18 @@
+-- Adds user statistics counters and the lock row of their reconcile job.
+-- The counters start empty: the reconcile job run at startup builds them
+-- from the user table.
+CREATE TABLE user_stat
+(
+    bucket_type VARCHAR(20) NOT NULL,
+    -- binary: buckets differing only in case or accents, like 'E' and 'É', stay apart
+    bucket VARCHAR(10) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    slot INTEGER UNSIGNED NOT NULL,
+    user_count BIGINT NOT NULL,
+    PRIMARY KEY (bucket_type, bucket, slot)
+);
+
+CREATE TABLE user_stat_reconcile
+(
+    name VARCHAR(50) PRIMARY KEY,
+    reconciled_at DATETIME(6)
+);
@@ -0,0 +1,3 @@
+-- Adds the version used for optimistic concurrency control (ETag / If-Match).
+-- Existing users start at version 1, like newly created ones.
+ALTER TABLE user ADD COLUMN version INTEGER UNSIGNED NOT NULL DEFAULT 1;
@@ -8,22 +8,41 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from simplecrud.lifespan import lifespan
-from simplecrud.router import health, user_crud
+from simplecrud.middleware.admission_control import AdmissionControlMiddleware
+from simplecrud.middleware.request_deadline import RequestDeadlineMiddleware
+from simplecrud.router import health, user_changes, user_crud, user_stats
+from simplecrud.settings import (
+    get_admission_control_settings,
+    get_request_deadline_settings,
+)
 from simplecrud.util.logging_util import setup_json_formatted_logging
 
 setup_json_formatted_logging()
 
 app = FastAPI(title="Simple CRUD", lifespan=lifespan)
 
+if get_request_deadline_settings().enabled:
+    app.add_middleware(
+        RequestDeadlineMiddleware, settings=get_request_deadline_settings()
+    )
+
+if get_admission_control_settings().enabled:
+    app.add_middleware(
+        AdmissionControlMiddleware, settings=get_admission_control_settings()
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 app.include_router(user_crud.router)
+app.include_router(user_changes.router)
+app.include_router(user_stats.router)
 app.include_router(health.router)
 
 app.add_middleware(MetricsMiddleware)
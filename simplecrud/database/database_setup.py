@@ -1,54 +1,140 @@
 import logging
+import math
+import time
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
+from sqlalchemy import Connection, event
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session, SessionTransaction
 
 from simplecrud.database.model import Base
-from simplecrud.settings import get_mysql_settings
+from simplecrud.database.timed_pool import TimedAsyncAdaptedQueuePool
+from simplecrud.middleware.request_deadline import get_request_deadline
+from simplecrud.settings import get_mysql_settings, get_request_deadline_settings
 from simplecrud.util.secret_manager_util import get_string_secret
 
-_engine: AsyncEngine
+DEADLINE_SESSION_INFO_KEY = "deadline"
+STATEMENT_TIMEOUT_CONNECTION_INFO_KEY = "statement_timeout"
+
 _async_session_maker: async_sessionmaker[AsyncSession]
+_shard_engines: list[AsyncEngine]
+_shard_session_makers: list[async_sessionmaker[AsyncSession]]
 
 
-@asynccontextmanager
-async def generate_async_engine() -> AsyncGenerator[None, None]:
-    if get_mysql_settings().url is None:
-        get_mysql_settings().url = await get_string_secret("MYSQL_URL")
-    connect_string = str(get_mysql_settings().url)
-    logging.info("creating async engine")
-    global _engine, _async_session_maker
-    _engine = create_async_engine(
+def create_shard_engine(connect_string: str) -> AsyncEngine:
+    if connect_string.startswith("sqlite"):
+        # local shards for development and tests
+        return create_async_engine(connect_string, echo=False)
+    return create_async_engine(
         connect_string,
         connect_args={"init_command": "SET SESSION time_zone='+00:00'"},
+        poolclass=TimedAsyncAdaptedQueuePool,
         pool_size=get_mysql_settings().pool_size,
         max_overflow=get_mysql_settings().max_overflow,
         pool_recycle=270,
         echo=False,
         query_cache_size=0,
     )
-    _async_session_maker = async_sessionmaker(_engine, expire_on_commit=False)
+
+
+async def get_shard_connect_strings() -> list[str]:
+    if get_mysql_settings().shard_urls:
+        return list(get_mysql_settings().shard_urls)
+    if get_mysql_settings().url is None:
+        get_mysql_settings().url = await get_string_secret("MYSQL_URL")
+    return [str(get_mysql_settings().url)]
+
+
+@asynccontextmanager
+async def generate_async_engine() -> AsyncGenerator[None, None]:
+    connect_strings = await get_shard_connect_strings()
+    logging.info(f"creating async engines for {len(connect_strings)} shards")
+    global _async_session_maker, _shard_engines, _shard_session_makers
+    _shard_engines = [
+        create_shard_engine(connect_string) for connect_string in connect_strings
+    ]
+    _shard_session_makers = [
+        async_sessionmaker(engine, expire_on_commit=False) for engine in _shard_engines
+    ]
+    # first shard serves requests which are not bound to a user, e.g. health checks
+    _async_session_maker = _shard_session_makers[0]
     try:
         yield
     finally:
-        logging.info("disposing async engine")
-        await _engine.dispose()
+        logging.info("disposing async engines")
+        for engine in _shard_engines:
+            await engine.dispose()
 
 
 async def make_tables() -> None:
-    async with _engine.begin() as connection:
-        await connection.run_sync(Base.metadata.create_all)
+    for engine in _shard_engines:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+
+def get_shard_session_makers() -> list[async_sessionmaker[AsyncSession]]:
+    return _shard_session_makers
+
+
+def open_session(session_maker: async_sessionmaker[AsyncSession]) -> AsyncSession:
+    session = session_maker()
+    session.info[DEADLINE_SESSION_INFO_KEY] = get_request_deadline()
+    return session
+
+
+@event.listens_for(Session, "after_begin")
+def apply_statement_timeout(
+    session: Session, transaction: SessionTransaction, connection: Connection
+) -> None:
+    """
+    Turns request deadline into MySQL statement and lock wait timeouts.
+    max_execution_time only applies to read-only SELECT statements; writes are
+    bounded server side by innodb_lock_wait_timeout alone. That covers the writes
+    of this service, which change single rows by unique key and are only slow
+    when waiting for row locks. A write cancelled by the deadline may still
+    finish on the server after the client gave up on it.
+    Session variables outlive the pooled connection checkout, so they are reset
+    when there is no deadline. The values set are remembered in the connection
+    info, which lives as long as the DB connection, so a connection left with
+    default timeouts gets no extra round trip.
+    """
+    if (
+        not get_request_deadline_settings().enabled
+        or connection.dialect.name != "mysql"
+    ):
+        return
+
+    applied_timeouts = connection.info.get(STATEMENT_TIMEOUT_CONNECTION_INFO_KEY)
+    deadline = session.info.get(DEADLINE_SESSION_INFO_KEY)
+    if deadline is None:
+        if applied_timeouts is not None:
+            connection.exec_driver_sql(
+                "SET SESSION max_execution_time = DEFAULT, "
+                "innodb_lock_wait_timeout = DEFAULT"
+            )
+            del connection.info[STATEMENT_TIMEOUT_CONNECTION_INFO_KEY]
+        return
+
+    remaining_seconds = max(deadline - time.monotonic(), 0.001)
+    timeouts = (math.ceil(remaining_seconds * 1000), math.ceil(remaining_seconds))
+    if timeouts == applied_timeouts:
+        return
+    connection.exec_driver_sql(
+        f"SET SESSION max_execution_time = {timeouts[0]}, "
+        f"innodb_lock_wait_timeout = {timeouts[1]}"
+    )
+    connection.info[STATEMENT_TIMEOUT_CONNECTION_INFO_KEY] = timeouts
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     try:
-        async with _async_session_maker() as session:
+        async with open_session(_async_session_maker) as session:
             yield session
     finally:
         await session.close()
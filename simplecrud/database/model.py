@@ -1,9 +1,11 @@
 import datetime
 
-from sqlalchemy import BigInteger, Integer, String
+from sqlalchemy import BINARY, BigInteger, Integer, String
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
+from simplecrud.database.sql_functions import utc_now
+
 
 class Base(AsyncAttrs, DeclarativeBase):  # pylint: disable=too-few-public-methods
     pass
@@ -12,8 +14,64 @@ class Base(AsyncAttrs, DeclarativeBase):  # pylint: disable=too-few-public-metho
 class User(Base):
     __tablename__ = "user"
     __mapper_args__ = {"eager_defaults": True}
-    id: Mapped[int] = mapped_column(BigInteger(), primary_key=True, autoincrement=True)
-    external_id: Mapped[str] = mapped_column(String(50), nullable=False)
+    # SQLite only auto increments INTEGER primary keys
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer(), "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    external_id: Mapped[bytes] = mapped_column(BINARY(16), nullable=False, unique=True)
+    first_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    last_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    birthday: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    version: Mapped[int] = mapped_column(Integer(), nullable=False, default=1)
+
+
+class UserChange(Base):
+    "Outbox record written in the same transaction as the user change"
+
+    __tablename__ = "user_change"
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer(), "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    external_id: Mapped[bytes] = mapped_column(BINARY(16), nullable=False)
+    change_type: Mapped[str] = mapped_column(String(10), nullable=False)
+    version: Mapped[int] = mapped_column(Integer(), nullable=False)
     first_name: Mapped[str] = mapped_column(String(50), nullable=False)
     last_name: Mapped[str] = mapped_column(String(50), nullable=False)
     birthday: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    # database time when the outbox row was inserted, the last statement of
+    # the transaction
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        nullable=False, default=utc_now()
+    )
+
+
+class OutboxRelayOffset(Base):
+    __tablename__ = "outbox_relay_offset"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_id: Mapped[int] = mapped_column(BigInteger(), nullable=False)
+
+
+class UserStat(Base):
+    "Number of users in a bucket, summed over slots"
+
+    __tablename__ = "user_stat"
+    bucket_type: Mapped[str] = mapped_column(String(20), primary_key=True)
+    # binary on MySQL, so "E" and "É" are different buckets as they are in Python
+    bucket: Mapped[str] = mapped_column(
+        String(10).with_variant(String(10, collation="utf8mb4_bin"), "mysql"),
+        primary_key=True,
+    )
+    slot: Mapped[int] = mapped_column(Integer(), primary_key=True)
+    user_count: Mapped[int] = mapped_column(BigInteger(), nullable=False)
+
+
+class UserStatReconcile(Base):
+    "Lock row serializing user statistics reconciles of the shard"
+
+    __tablename__ = "user_stat_reconcile"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    reconciled_at: Mapped[datetime.datetime | None] = mapped_column(nullable=True)
@@ -0,0 +1,140 @@
+"""
+Moves users to the shards they belong to after shards were added.
+
+Usage: MYSQL_SHARD_URLS='[...]' python -m simplecrud.database.rebalance_shards
+
+Shard URLs must keep the previous order with new shards appended.
+Procedure when adding a shard:
+1. create the tables on the new shard
+2. deploy the application with the new shard list and MYSQL_PREVIOUS_SHARD_COUNT
+   set to the old shard count: users are created on their new shards, while
+   users not moved yet are still read, updated and deleted on their old shards
+3. run this script
+4. deploy the application without MYSQL_PREVIOUS_SHARD_COUNT
+The old shard stays authoritative for a user until the move deletes the user
+there, so copies left by an interrupted run are never served and rerunning
+is safe. User statistics of all shards are reconciled when rebalancing finishes.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Sequence
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import (
+    generate_async_engine,
+    get_shard_session_makers,
+)
+from simplecrud.database.model import User
+from simplecrud.database.sharding import shard_for_external_id
+from simplecrud.stats.stats_reconciler import reconcile_user_stats
+
+log = logging.getLogger(__name__)
+
+
+async def rebalance_shards(
+    session_makers: Sequence[async_sessionmaker[AsyncSession]],
+    batch_size: int = 500,
+) -> int:
+    "Returns number of users moved"
+    moved_count = 0
+    for source_shard, source_session_maker in enumerate(session_makers):
+        last_id = 0
+        while True:
+            async with source_session_maker() as session:
+                users = (
+                    await session.execute(
+                        select(User.id, User.external_id)
+                        .where(User.id > last_id)
+                        .order_by(User.id)
+                        .limit(batch_size)
+                    )
+                ).all()
+            if not users:
+                break
+            last_id = users[-1].id
+
+            misplaced_ids: dict[int, list[bytes]] = defaultdict(list)
+            for user in users:
+                target_shard = shard_for_external_id(
+                    user.external_id, len(session_makers)
+                )
+                if target_shard != source_shard:
+                    misplaced_ids[target_shard].append(user.external_id)
+
+            for target_shard, external_ids in misplaced_ids.items():
+                moved_count += await move_users(
+                    external_ids, source_session_maker, session_makers[target_shard]
+                )
+
+        log.info(f"Shard {source_shard} rebalanced")
+    return moved_count
+
+
+async def move_users(
+    external_ids: list[bytes],
+    source_session_maker: async_sessionmaker[AsyncSession],
+    target_session_maker: async_sessionmaker[AsyncSession],
+) -> int:
+    """
+    Copies users to the target shard and deletes them from the source shard.
+    Source rows stay locked until they are deleted, so users changed or deleted
+    by the application in the meantime are either moved in their latest version
+    or not at all. Returns number of users moved.
+    """
+    async with source_session_maker() as session, session.begin():
+        users = list(
+            await session.scalars(
+                select(User).where(User.external_id.in_(external_ids)).with_for_update()
+            )
+        )
+        if not users:
+            return 0
+
+        await copy_users(users, target_session_maker)
+        await session.execute(
+            delete(User)
+            .where(User.external_id.in_([user.external_id for user in users]))
+            .execution_options(synchronize_session=False)
+        )
+    return len(users)
+
+
+async def copy_users(
+    users: list[User], target_session_maker: async_sessionmaker[AsyncSession]
+) -> None:
+    "Replaces copies left on the target by an interrupted move"
+    async with target_session_maker() as session, session.begin():
+        await session.execute(
+            delete(User).where(
+                User.external_id.in_([user.external_id for user in users])
+            )
+        )
+        await session.execute(
+            insert(User),
+            [
+                {
+                    "external_id": user.external_id,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "birthday": user.birthday,
+                    "version": user.version,
+                }
+                for user in users
+            ],
+        )
+
+
+async def main() -> None:
+    async with generate_async_engine():
+        moved_count = await rebalance_shards(get_shard_session_makers())
+        await reconcile_user_stats(get_shard_session_makers())
+    log.info(f"Rebalancing finished, {moved_count} users were moved")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
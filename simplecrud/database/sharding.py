@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Sequence, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import get_shard_session_makers, open_session
+from simplecrud.settings import get_mysql_settings
+
+T = TypeVar("T")
+
+_JUMP_HASH_MULTIPLIER = 2862933555777941757
+_UINT64_MASK = 0xFFFF_FFFF_FFFF_FFFF
+
+
+def jump_consistent_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach): when buckets grows from N to N + 1,
+    only 1 / (N + 1) of keys move, all of them to the new bucket.
+    """
+    bucket, next_bucket = -1, 0
+    while next_bucket < buckets:
+        bucket = next_bucket
+        key = (key * _JUMP_HASH_MULTIPLIER + 1) & _UINT64_MASK
+        next_bucket = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_external_id(external_id: bytes, shard_count: int) -> int:
+    key = int.from_bytes(hashlib.blake2b(external_id, digest_size=8).digest(), "big")
+    return jump_consistent_hash(key, shard_count)
+
+
+class ShardSessions:
+    "Opens sessions on the shard owning a user or on all shards at once"
+
+    def __init__(
+        self,
+        session_makers: Sequence[async_sessionmaker[AsyncSession]],
+        previous_shard_count: int | None = None,
+    ) -> None:
+        self.session_makers = session_makers
+        self.previous_shard_count = previous_shard_count
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.session_makers)
+
+    def session_for(self, external_id: bytes) -> AsyncSession:
+        shard = shard_for_external_id(external_id, self.shard_count)
+        return self.session_for_shard(shard)
+
+    def user_shards(self, external_id: bytes) -> list[int]:
+        """
+        Shards which may hold the user, the one to trust first. While rebalancing
+        is unfinished, a user found on the previous shard was not moved yet and
+        its copy on the new shard, if any, is left over from an interrupted move.
+        """
+        shard = shard_for_external_id(external_id, self.shard_count)
+        if self.previous_shard_count is None:
+            return [shard]
+        previous_shard = shard_for_external_id(external_id, self.previous_shard_count)
+        if previous_shard == shard:
+            return [shard]
+        return [previous_shard, shard]
+
+    def session_for_shard(self, shard: int) -> AsyncSession:
+        return open_session(self.session_makers[shard])
+
+    async def fan_out(self, query: Callable[[AsyncSession], Awaitable[T]]) -> list[T]:
+        "Runs query concurrently on every shard, results are in shard order"
+
+        async def run_on_shard(session_maker: async_sessionmaker[AsyncSession]) -> T:
+            async with open_session(session_maker) as session:
+                return await query(session)
+
+        return await asyncio.gather(
+            *[run_on_shard(session_maker) for session_maker in self.session_makers]
+        )
+
+
+async def get_shard_sessions() -> ShardSessions:
+    return ShardSessions(
+        get_shard_session_makers(), get_mysql_settings().previous_shard_count
+    )
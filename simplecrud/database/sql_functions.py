@@ -0,0 +1,24 @@
+import datetime
+from typing import Any
+
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class utc_now(FunctionElement[datetime.datetime]):  # pylint: disable=invalid-name
+    "Current UTC time of the database server with microseconds"
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now, "mysql")  # type: ignore[no-untyped-call, untyped-decorator]
+def compile_mysql_utc_now(element: utc_now, compiler: SQLCompiler, **kw: Any) -> str:
+    return "UTC_TIMESTAMP(6)"
+
+
+@compiles(utc_now, "sqlite")  # type: ignore[no-untyped-call, untyped-decorator]
+def compile_sqlite_utc_now(element: utc_now, compiler: SQLCompiler, **kw: Any) -> str:
+    return "STRFTIME('%Y-%m-%d %H:%M:%f', 'now')"
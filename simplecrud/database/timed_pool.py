@@ -0,0 +1,33 @@
+import time
+from contextvars import ContextVar
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+
+class PoolWait:
+    "Accumulates time spent waiting for pooled connections during one request"
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+
+
+_pool_wait: ContextVar[PoolWait | None] = ContextVar("pool_wait", default=None)
+
+
+def start_pool_wait_tracking() -> PoolWait:
+    pool_wait = PoolWait()
+    _pool_wait.set(pool_wait)
+    return pool_wait
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    "Adds time spent waiting for a connection to the PoolWait of current request"
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait = _pool_wait.get()
+            if pool_wait is not None:
+                pool_wait.seconds += time.perf_counter() - start_time
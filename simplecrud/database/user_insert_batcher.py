@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Sequence, Set
+
+from aioprometheus.collectors import Counter, Gauge, Histogram
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import get_shard_session_makers
+from simplecrud.database.model import User, UserChange
+from simplecrud.database.sharding import shard_for_external_id
+from simplecrud.outbox.user_changes import created_change_row
+from simplecrud.settings import get_user_insert_batch_settings
+from simplecrud.stats.user_stats import (
+    apply_stats_deltas,
+    count_users,
+    new_stats_deltas,
+)
+
+log = logging.getLogger(__name__)
+
+_batch_max_size_gauge = Gauge(
+    "user_insert_batch_max_size", "Max number of rows in one user insert batch"
+)
+_batch_max_wait_gauge = Gauge(
+    "user_insert_batch_max_wait_ms", "Max time a user insert waits for its batch"
+)
+_batch_size_histogram = Histogram(
+    "user_insert_batch_size",
+    "Number of rows flushed in one user insert batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+_batch_failures_counter = Counter(
+    "user_insert_batch_failures",
+    "User insert batches that failed and were retried row by row",
+)
+
+PendingRow = tuple[dict[str, Any], asyncio.Future[None]]
+
+
+class UserInsertBatcher:
+    """
+    Collects concurrent user inserts and flushes them as one multi-row INSERT
+    in one transaction per shard, together with their outbox records
+    and user statistics.
+    When a batch fails, its rows are retried one by one
+    so a single bad row only fails its own caller.
+    """
+
+    def __init__(
+        self,
+        session_makers: Sequence[async_sessionmaker[AsyncSession]],
+        max_size: int,
+        max_wait_ms: float,
+    ) -> None:
+        self._session_makers = session_makers
+        self._max_size = max_size
+        self._max_wait_seconds = max_wait_ms / 1000
+        self._pending: list[PendingRow] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._flush_tasks: Set[asyncio.Task[None]] = set()
+
+    async def insert(self, row: dict[str, Any]) -> None:
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self._max_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self._max_wait_seconds, self._start_flush
+            )
+        await future
+
+    async def close(self) -> None:
+        self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks)
+
+    def _start_flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+
+        shard_batches: dict[int, list[PendingRow]] = defaultdict(list)
+        for pending_row in self._pending:
+            shard = shard_for_external_id(
+                pending_row[0]["external_id"], len(self._session_makers)
+            )
+            shard_batches[shard].append(pending_row)
+        self._pending = []
+
+        for shard, batch in shard_batches.items():
+            # observed here, row by row retries of a failed batch are not windows
+            _batch_size_histogram.observe({}, len(batch))
+            flush_task = asyncio.create_task(
+                self._flush(self._session_makers[shard], batch)
+            )
+            self._flush_tasks.add(flush_task)
+            flush_task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        batch: list[PendingRow],
+    ) -> None:
+        try:
+            async with session_maker() as session, session.begin():
+                await session.execute(insert(User), [row for row, _ in batch])
+                stats_deltas = new_stats_deltas()
+                count_users(stats_deltas, [row for row, _ in batch])
+                await apply_stats_deltas(session, stats_deltas)
+                await session.execute(
+                    insert(UserChange), [created_change_row(row) for row, _ in batch]
+                )
+        except SQLAlchemyError as e:
+            if len(batch) == 1:
+                set_exception(batch[0][1], e)
+                return
+            log.warning(
+                f"User insert batch of {len(batch)} rows failed, retrying row by row"
+            )
+            _batch_failures_counter.inc({})
+            for pending_row in batch:
+                await self._flush(session_maker, [pending_row])
+            return
+        except Exception as e:
+            for _, future in batch:
+                set_exception(future, e)
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+def set_exception(future: asyncio.Future[None], exception: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exception)
+
+
+_user_insert_batcher: UserInsertBatcher | None = None
+
+
+async def get_user_insert_batcher() -> UserInsertBatcher | None:
+    return _user_insert_batcher
+
+
+@asynccontextmanager
+async def generate_user_insert_batcher() -> AsyncGenerator[None, None]:
+    settings = get_user_insert_batch_settings()
+    if not settings.enabled:
+        yield
+        return
+
+    global _user_insert_batcher
+    log.info(
+        f"Starting user insert batcher: max_size={settings.max_size}, "
+        f"max_wait_ms={settings.max_wait_ms}"
+    )
+    _batch_max_size_gauge.set({}, settings.max_size)
+    _batch_max_wait_gauge.set({}, settings.max_wait_ms)
+    _user_insert_batcher = UserInsertBatcher(
+        get_shard_session_makers(), settings.max_size, settings.max_wait_ms
+    )
+    try:
+        yield
+    finally:
+        log.info("Flushing user insert batcher")
+        await _user_insert_batcher.close()
+        _user_insert_batcher = None
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncGenerator
+
+from aioprometheus.collectors import Histogram
+
+from simplecrud.settings import get_event_loop_monitor_settings
+
+log = logging.getLogger(__name__)
+
+_event_loop_lag_histogram = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between scheduled and actual wake up of the event loop monitor",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class BlockedEventLoopWatchdog:
+    """
+    Thread which logs the stack of the event loop thread when the loop
+    didn't report a heartbeat for longer than block_threshold_seconds.
+    """
+
+    def __init__(
+        self,
+        loop_thread_id: int,
+        interval_seconds: float,
+        block_threshold_seconds: float,
+    ) -> None:
+        self.loop_thread_id = loop_thread_id
+        self.interval_seconds = interval_seconds
+        self.block_threshold_seconds = block_threshold_seconds
+        self._last_heartbeat = time.monotonic()
+        self._block_reported = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self.run, name="event-loop-watchdog", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def heartbeat(self) -> None:
+        self._last_heartbeat = time.monotonic()
+        self._block_reported = False
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.block_threshold_seconds / 2):
+            blocked_seconds = (
+                time.monotonic() - self._last_heartbeat - self.interval_seconds
+            )
+            if blocked_seconds < self.block_threshold_seconds or self._block_reported:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self._block_reported = True
+            log.warning(
+                f"Event loop blocked for at least {blocked_seconds * 1000:.0f} ms",
+                extra={"blocked_stack": "".join(traceback.format_stack(frame))},
+            )
+
+
+async def monitor_event_loop_lag(
+    interval_seconds: float, watchdog: BlockedEventLoopWatchdog
+) -> None:
+    while True:
+        start_time = time.perf_counter()
+        await asyncio.sleep(interval_seconds)
+        lag = time.perf_counter() - start_time - interval_seconds
+        _event_loop_lag_histogram.observe({}, max(lag, 0.0))
+        watchdog.heartbeat()
+
+
+@asynccontextmanager
+async def generate_event_loop_monitor() -> AsyncGenerator[None, None]:
+    settings = get_event_loop_monitor_settings()
+    if not settings.enabled:
+        yield
+        return
+
+    interval_seconds = settings.interval_ms / 1000
+    watchdog = BlockedEventLoopWatchdog(
+        threading.get_ident(), interval_seconds, settings.block_threshold_ms / 1000
+    )
+    watchdog.start()
+    monitor_task = asyncio.create_task(
+        monitor_event_loop_lag(interval_seconds, watchdog)
+    )
+    try:
+        yield
+    finally:
+        log.info("Stopping event loop monitor")
+        monitor_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await monitor_task
+        await asyncio.to_thread(watchdog.stop)
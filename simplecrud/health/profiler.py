@@ -0,0 +1,60 @@
+import asyncio
+import collections
+import sys
+import threading
+from types import FrameType
+
+_profile_lock = asyncio.Lock()
+
+
+def is_profile_running() -> bool:
+    return _profile_lock.locked()
+
+
+def collapse_stack(thread_name: str, frame: FrameType | None) -> str:
+    frames = []
+    while frame is not None:
+        frames.append(f"{frame.f_code.co_qualname} ({frame.f_code.co_filename})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+def sample_stacks(
+    stop_event: threading.Event,
+    interval_seconds: float,
+    stacks: collections.Counter[str],
+) -> None:
+    sampler_thread_id = threading.get_ident()
+    while not stop_event.wait(interval_seconds):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_thread_id:
+                continue
+            thread_name = thread_names.get(thread_id, str(thread_id))
+            stacks[collapse_stack(thread_name, frame)] += 1
+
+
+async def profile(duration_seconds: float, interval_seconds: float) -> str:
+    """
+    Samples stacks of all threads of the process, including the event loop thread,
+    from a separate thread for duration_seconds.
+    Returns collapsed stacks ("root;...;leaf count" per line) usable for flamegraphs.
+    """
+    async with _profile_lock:
+        stacks: collections.Counter[str] = collections.Counter()
+        stop_event = threading.Event()
+        sampler_thread = threading.Thread(
+            target=sample_stacks,
+            args=(stop_event, interval_seconds, stacks),
+            name="sampling-profiler",
+            daemon=True,
+        )
+        sampler_thread.start()
+        try:
+            await asyncio.sleep(duration_seconds)
+        finally:
+            stop_event.set()
+            await asyncio.to_thread(sampler_thread.join)
+
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
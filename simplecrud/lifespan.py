@@ -4,10 +4,23 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
 from simplecrud.database.database_setup import generate_async_engine
+from simplecrud.database.user_insert_batcher import generate_user_insert_batcher
+from simplecrud.health.event_loop_monitor import generate_event_loop_monitor
 from simplecrud.jobsimulation.job_processor import generate_job_processor
+from simplecrud.outbox.outbox_pruner import generate_outbox_pruner
+from simplecrud.outbox.outbox_relay import generate_outbox_relay
+from simplecrud.stats.stats_reconciler import generate_stats_reconciler
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    async with generate_async_engine(), generate_job_processor():
+    async with (
+        generate_event_loop_monitor(),
+        generate_async_engine(),
+        generate_user_insert_batcher(),
+        generate_outbox_relay(),
+        generate_outbox_pruner(),
+        generate_stats_reconciler(),
+        generate_job_processor(),
+    ):
         yield
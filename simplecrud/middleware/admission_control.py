@@ -0,0 +1,176 @@
+import logging
+from http import HTTPStatus
+from typing import Sequence
+
+from aioprometheus.collectors import Counter, Gauge, Histogram
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from simplecrud.database.timed_pool import start_pool_wait_tracking
+from simplecrud.settings import AdmissionControlSettings
+
+log = logging.getLogger(__name__)
+
+READ_ROUTE_CLASS = "read"
+WRITE_ROUTE_CLASS = "write"
+STREAM_ROUTE_CLASS = "stream"
+_READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_admitted_counter = Counter(
+    "admission_control_admitted", "Requests admitted by admission control"
+)
+_shed_counter = Counter(
+    "admission_control_shed", "Requests rejected by admission control with 503"
+)
+_in_flight_gauge = Gauge(
+    "admission_control_in_flight", "Requests currently admitted and running"
+)
+_limit_gauge = Gauge(
+    "admission_control_limit", "Current concurrency limit of admission control"
+)
+_pool_wait_histogram = Histogram(
+    "admission_control_pool_wait_seconds",
+    "Time admitted requests spent waiting for DB pool connections",
+)
+
+
+class ConcurrencyLimiter:
+    "Admits at most 'limit' requests at a time"
+
+    def __init__(self, route_class: str, limit: float) -> None:
+        self.route_class = route_class
+        self.limit = limit
+        self.in_flight = 0
+        _limit_gauge.set({"route_class": route_class}, limit)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        _in_flight_gauge.set({"route_class": self.route_class}, self.in_flight)
+        return True
+
+    def release(self, pool_wait_seconds: float) -> None:
+        self.in_flight -= 1
+        _in_flight_gauge.set({"route_class": self.route_class}, self.in_flight)
+
+
+class AimdConcurrencyLimiter(ConcurrencyLimiter):
+    """
+    Additive increase / multiplicative decrease limit:
+    grows by ~1 per 'limit' requests while pool wait stays under target,
+    shrinks by backoff_ratio on every request that waited longer.
+    """
+
+    def __init__(
+        self,
+        route_class: str,
+        limit: float,
+        min_limit: int,
+        max_limit: int,
+        pool_wait_target_seconds: float,
+        backoff_ratio: float,
+    ) -> None:
+        super().__init__(route_class, limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.pool_wait_target_seconds = pool_wait_target_seconds
+        self.backoff_ratio = backoff_ratio
+
+    def release(self, pool_wait_seconds: float) -> None:
+        super().release(pool_wait_seconds)
+        if pool_wait_seconds > self.pool_wait_target_seconds:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        _limit_gauge.set({"route_class": self.route_class}, self.limit)
+
+
+def generate_limiters(
+    settings: AdmissionControlSettings,
+) -> dict[str, ConcurrencyLimiter]:
+    limits = {
+        READ_ROUTE_CLASS: settings.read_limit,
+        WRITE_ROUTE_CLASS: settings.write_limit,
+    }
+    limiters: dict[str, ConcurrencyLimiter]
+    if settings.mode == "aimd":
+        limiters = {
+            route_class: AimdConcurrencyLimiter(
+                route_class,
+                limit,
+                settings.min_limit,
+                settings.max_limit,
+                settings.pool_wait_target_ms / 1000,
+                settings.backoff_ratio,
+            )
+            for route_class, limit in limits.items()
+        }
+    else:
+        limiters = {
+            route_class: ConcurrencyLimiter(route_class, limit)
+            for route_class, limit in limits.items()
+        }
+    # long polls hold no pool connection while waiting, their pool wait
+    # says nothing about load, so their limit doesn't adapt
+    limiters[STREAM_ROUTE_CLASS] = ConcurrencyLimiter(
+        STREAM_ROUTE_CLASS, settings.stream_limit
+    )
+    return limiters
+
+
+class AdmissionControlMiddleware:
+    """
+    Rejects requests with 503 and Retry-After when too many requests of the same
+    route class (read / write / stream) are in flight, instead of letting them
+    queue for a DB pool connection until the client times out.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        settings: AdmissionControlSettings,
+        exempt_path_prefixes: Sequence[str] = ("/_health",),
+        stream_path_prefixes: Sequence[str] = ("/v1/user-changes",),
+    ) -> None:
+        self.app = app
+        self.retry_after_seconds = settings.retry_after_seconds
+        self.exempt_path_prefixes = tuple(exempt_path_prefixes)
+        self.stream_path_prefixes = tuple(stream_path_prefixes)
+        self.limiters = generate_limiters(settings)
+
+    def route_class(self, scope: Scope) -> str:
+        if scope["path"].startswith(self.stream_path_prefixes):
+            return STREAM_ROUTE_CLASS
+        if scope["method"] in _READ_METHODS:
+            return READ_ROUTE_CLASS
+        return WRITE_ROUTE_CLASS
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(
+            self.exempt_path_prefixes
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.route_class(scope)
+        labels = {"route_class": route_class}
+        limiter = self.limiters[route_class]
+        if not limiter.try_acquire():
+            log.debug(f"Shedding {scope['method']} {scope['path']}")
+            _shed_counter.inc(labels)
+            response = JSONResponse(
+                {"detail": "Service is overloaded, retry later"},
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE.value,
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+            await response(scope, receive, send)
+            return
+
+        _admitted_counter.inc(labels)
+        pool_wait = start_pool_wait_tracking()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _pool_wait_histogram.observe(labels, pool_wait.seconds)
+            limiter.release(pool_wait.seconds)
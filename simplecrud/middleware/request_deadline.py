@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from http import HTTPStatus
+from typing import Any, Sequence
+
+from sqlalchemy.exc import DBAPIError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from simplecrud.settings import RequestDeadlineSettings
+
+log = logging.getLogger(__name__)
+
+# ER_QUERY_TIMEOUT (max_execution_time) and ER_LOCK_WAIT_TIMEOUT
+_MYSQL_TIMEOUT_ERROR_CODES = {3024, 1205}
+
+_request_deadline: ContextVar[float | None] = ContextVar(
+    "request_deadline", default=None
+)
+
+
+def get_request_deadline() -> float | None:
+    "Returns time.monotonic() based deadline of the current request, if any"
+    return _request_deadline.get()
+
+
+def is_statement_timeout(error: DBAPIError) -> bool:
+    error_args: tuple[Any, ...] = getattr(error.orig, "args", ())
+    return len(error_args) > 0 and error_args[0] in _MYSQL_TIMEOUT_ERROR_CODES
+
+
+class RequestDeadlineMiddleware:
+    """
+    Bounds every request by a deadline: configured default, or any deadline up to the
+    configured maximum requested by the client header. The deadline is exposed
+    through get_request_deadline() so DB sessions can turn it into a statement
+    timeout. Requests over the deadline are cancelled, which releases their
+    connections, and get 504.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        settings: RequestDeadlineSettings,
+        exempt_path_prefixes: Sequence[str] = ("/_health/profile",),
+    ) -> None:
+        self.app = app
+        self.exempt_path_prefixes = tuple(exempt_path_prefixes)
+        self.default_ms = settings.default_ms
+        self.max_ms = settings.max_ms
+        self.header = settings.header
+
+    def timeout_ms(self, scope: Scope) -> int:
+        header_value = Headers(scope=scope).get(self.header)
+        if header_value is None:
+            return self.default_ms
+        try:
+            return max(1, min(int(header_value), self.max_ms))
+        except ValueError:
+            return self.default_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(
+            self.exempt_path_prefixes
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        timeout_ms = self.timeout_ms(scope)
+        token = _request_deadline.set(time.monotonic() + timeout_ms / 1000)
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            async with asyncio.timeout(timeout_ms / 1000) as timeout:
+                await self.app(scope, receive, send_wrapper)
+        except TimeoutError:
+            if not timeout.expired() or response_started:
+                raise
+            await self.deadline_exceeded(scope, receive, send, timeout_ms)
+        except DBAPIError as e:
+            if not is_statement_timeout(e) or response_started:
+                raise
+            await self.deadline_exceeded(scope, receive, send, timeout_ms)
+        finally:
+            _request_deadline.reset(token)
+
+    async def deadline_exceeded(
+        self, scope: Scope, receive: Receive, send: Send, timeout_ms: int
+    ) -> None:
+        log.warning(
+            f"Request deadline of {timeout_ms} ms exceeded: "
+            f"{scope['method']} {scope['path']}"
+        )
+        response = JSONResponse(
+            {"detail": f"Request deadline of {timeout_ms} ms exceeded"},
+            status_code=HTTPStatus.GATEWAY_TIMEOUT.value,
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,48 @@
+import asyncio
+from collections import deque
+from typing import Protocol
+
+from simplecrud.schema import UserChangeEvent
+from simplecrud.settings import get_outbox_settings
+
+
+class ChangeSink(Protocol):
+    "Destination of user changes published by the outbox relay"
+
+    async def publish(self, changes: list[UserChangeEvent]) -> None: ...
+
+
+class InMemoryChangeSink:
+    "Keeps the latest changes only, for tests and local runs"
+
+    def __init__(self, max_size: int = 10_000) -> None:
+        self.changes: deque[UserChangeEvent] = deque(maxlen=max_size)
+
+    async def publish(self, changes: list[UserChangeEvent]) -> None:
+        self.changes.extend(changes)
+
+
+class FileChangeSink:
+    "Appends changes to a file as JSON lines"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    async def publish(self, changes: list[UserChangeEvent]) -> None:
+        lines = "".join(
+            f"{change.model_dump_json(by_alias=True)}\n" for change in changes
+        )
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+def generate_change_sink() -> ChangeSink:
+    settings = get_outbox_settings()
+    if settings.sink == "file":
+        return FileChangeSink(settings.file_sink_path)
+    if settings.sink == "memory":
+        return InMemoryChangeSink()
+    raise ValueError("OUTBOX_SINK is not set")
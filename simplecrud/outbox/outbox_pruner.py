@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Sequence
+
+from aioprometheus.collectors import Counter
+from sqlalchemy import ColumnElement, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import get_shard_session_makers
+from simplecrud.database.model import OutboxRelayOffset, UserChange
+from simplecrud.database.sql_functions import utc_now
+from simplecrud.jobsimulation.job_processor import cancel_job_processor
+from simplecrud.settings import get_outbox_settings
+
+log = logging.getLogger(__name__)
+
+_pruned_changes_counter = Counter(
+    "outbox_pruned_changes", "User changes deleted after the outbox retention"
+)
+
+
+async def prune_shard(
+    session_maker: async_sessionmaker[AsyncSession],
+    retention_days: float,
+    batch_size: int,
+    relay_enabled: bool,
+) -> int:
+    """
+    Deletes changes of one shard older than the retention. With the relay
+    enabled, changes after the lowest relay offset are kept until published.
+    Changes are deleted in batches, each in its own short transaction.
+    Returns number of changes deleted.
+    """
+    pruned_count = 0
+    while True:
+        async with session_maker() as session, session.begin():
+            database_now = (await session.execute(select(utc_now()))).scalar_one()
+            condition: ColumnElement[bool] = UserChange.created_at < (
+                database_now - datetime.timedelta(days=retention_days)
+            )
+            if relay_enabled:
+                relay_last_id = await session.scalar(
+                    select(func.min(OutboxRelayOffset.last_id))
+                )
+                condition &= UserChange.id <= (relay_last_id or 0)
+            change_ids = list(
+                await session.scalars(
+                    select(UserChange.id)
+                    .where(condition)
+                    .order_by(UserChange.id)
+                    .limit(batch_size)
+                )
+            )
+            if change_ids:
+                await session.execute(
+                    delete(UserChange)
+                    .where(UserChange.id.in_(change_ids))
+                    .execution_options(synchronize_session=False)
+                )
+        pruned_count += len(change_ids)
+        if len(change_ids) < batch_size:
+            return pruned_count
+
+
+async def prune_outbox(
+    session_makers: Sequence[async_sessionmaker[AsyncSession]],
+) -> int:
+    settings = get_outbox_settings()
+    pruned_count = 0
+    for shard, session_maker in enumerate(session_makers):
+        shard_pruned_count = await prune_shard(
+            session_maker,
+            settings.retention_days,
+            settings.prune_batch_size,
+            settings.relay_enabled,
+        )
+        if shard_pruned_count > 0:
+            log.info(f"Pruned {shard_pruned_count} user changes on shard {shard}")
+            _pruned_changes_counter.add({"shard": str(shard)}, shard_pruned_count)
+        pruned_count += shard_pruned_count
+    return pruned_count
+
+
+async def outbox_pruner(interval_seconds: float) -> None:
+    while True:
+        try:
+            await prune_outbox(get_shard_session_makers())
+            await asyncio.sleep(interval_seconds)
+        except asyncio.CancelledError:
+            log.info("outbox_pruner: cancelled")
+            raise
+        except Exception:
+            log.exception("Exception raised by outbox pruner")
+            await asyncio.sleep(60)
+
+
+@asynccontextmanager
+async def generate_outbox_pruner() -> AsyncGenerator[None, None]:
+    settings = get_outbox_settings()
+    if not settings.prune_enabled:
+        yield
+        return
+
+    # a prune transaction rolls back when cancelled, so no graceful wait
+    outbox_pruner_task = asyncio.create_task(
+        outbox_pruner(settings.prune_interval_seconds)
+    )
+    try:
+        yield
+    finally:
+        log.info("Stopping outbox pruner")
+        await cancel_job_processor(outbox_pruner_task)
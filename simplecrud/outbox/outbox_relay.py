@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+from aioprometheus.collectors import Counter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import get_shard_session_makers
+from simplecrud.database.model import OutboxRelayOffset
+from simplecrud.jobsimulation.job_processor import cancel_job_processor
+from simplecrud.outbox.change_sink import ChangeSink, generate_change_sink
+from simplecrud.outbox.user_changes import fetch_changes, to_change_event
+from simplecrud.settings import get_outbox_settings
+
+RELAY_NAME = "user_change_relay"
+
+log = logging.getLogger(__name__)
+
+_published_changes_counter = Counter(
+    "outbox_published_changes", "User changes published by the outbox relay"
+)
+
+_shutdown: bool = False
+
+
+async def relay_shard(
+    shard: int,
+    session_maker: async_sessionmaker[AsyncSession],
+    sink: ChangeSink,
+    batch_size: int,
+    gap_timeout_seconds: float,
+) -> int:
+    """
+    Publishes next batch of changes of one shard and moves the relay offset.
+    The offset row is locked, so only one relay publishes a shard at a time.
+    Delivery is at least once: the batch is published again if the commit fails.
+    """
+    async with session_maker() as session, session.begin():
+        relay_offset = await session.scalar(
+            select(OutboxRelayOffset)
+            .where(OutboxRelayOffset.name == RELAY_NAME)
+            .with_for_update()
+        )
+        last_id = relay_offset.last_id if relay_offset is not None else 0
+        changes = await fetch_changes(session, last_id, batch_size, gap_timeout_seconds)
+        if not changes:
+            return 0
+
+        await sink.publish([to_change_event(shard, change) for change in changes])
+        if relay_offset is None:
+            session.add(OutboxRelayOffset(name=RELAY_NAME, last_id=changes[-1].id))
+        else:
+            relay_offset.last_id = changes[-1].id
+
+    _published_changes_counter.add({"shard": str(shard)}, len(changes))
+    return len(changes)
+
+
+async def outbox_relay(sink: ChangeSink) -> None:
+    settings = get_outbox_settings()
+    while not _shutdown:
+        try:
+            published_count = 0
+            for shard, session_maker in enumerate(get_shard_session_makers()):
+                published_count += await relay_shard(
+                    shard,
+                    session_maker,
+                    sink,
+                    settings.batch_size,
+                    settings.gap_timeout_ms / 1000,
+                )
+            if published_count == 0:
+                await asyncio.sleep(settings.poll_interval_ms / 1000)
+        except asyncio.CancelledError:
+            log.info("outbox_relay: cancelled")
+            raise
+        except Exception:
+            log.exception("Exception raised by outbox relay")
+            await asyncio.sleep(5)
+    log.info("outbox_relay shutdown")
+
+
+@asynccontextmanager
+async def generate_outbox_relay() -> AsyncGenerator[None, None]:
+    if not get_outbox_settings().relay_enabled:
+        yield
+        return
+
+    global _shutdown
+    _shutdown = False
+    outbox_relay_task = asyncio.create_task(outbox_relay(generate_change_sink()))
+    try:
+        yield
+    finally:
+        log.info("Stopping outbox relay")
+        _shutdown = True
+        shutdown_start_time = time.perf_counter()
+        while not outbox_relay_task.done():
+            if time.perf_counter() - shutdown_start_time > 15.0:
+                log.info("Graceful shutdown wait time exceeded, cancelling relay")
+                break
+            await asyncio.sleep(0.1)
+
+        if not outbox_relay_task.done():
+            await cancel_job_processor(outbox_relay_task)
@@ -0,0 +1,104 @@
+import datetime
+from typing import Any
+
+from sqlalchemy import Insert, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from simplecrud.database.model import User, UserChange
+from simplecrud.database.sql_functions import utc_now
+from simplecrud.schema import UserChangeEvent
+from simplecrud.util.id_util import encode_external_id
+
+USER_CREATED = "created"
+USER_UPDATED = "updated"
+USER_DELETED = "deleted"
+
+
+def created_change_row(user_row: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "external_id": user_row["external_id"],
+        "change_type": USER_CREATED,
+        "version": 1,
+        "first_name": user_row["first_name"],
+        "last_name": user_row["last_name"],
+        "birthday": user_row["birthday"],
+    }
+
+
+def deleted_change_row(user: User) -> dict[str, Any]:
+    return {
+        "external_id": user.external_id,
+        "change_type": USER_DELETED,
+        "version": user.version,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "birthday": user.birthday,
+    }
+
+
+def insert_change_from_users(change_type: str, condition: Any) -> Insert:
+    """
+    Copies current state of the users matching condition into the outbox.
+    Like every outbox insert, it must be the last statement of the transaction:
+    readers wait for gaps in change ids only for a limited time.
+    """
+    return insert(UserChange).from_select(
+        [
+            UserChange.external_id,
+            UserChange.change_type,
+            UserChange.version,
+            UserChange.first_name,
+            UserChange.last_name,
+            UserChange.birthday,
+            UserChange.created_at,
+        ],
+        select(
+            User.external_id,
+            literal(change_type),
+            User.version,
+            User.first_name,
+            User.last_name,
+            User.birthday,
+            utc_now(),
+        ).where(condition),
+    )
+
+
+async def fetch_changes(
+    async_session: AsyncSession, after_id: int, limit: int, gap_timeout_seconds: float
+) -> list[UserChange]:
+    """
+    Returns changes after the id, stopping at a recent gap in ids: the missing id
+    may belong to a transaction which is still committing. A gap older than the
+    timeout is left behind by a rolled back transaction.
+    Ages are measured by the database clock, which also wrote created_at.
+    """
+    result = await async_session.execute(
+        select(UserChange, utc_now())
+        .where(UserChange.id > after_id)
+        .order_by(UserChange.id)
+        .limit(limit)
+    )
+    gap_timeout = datetime.timedelta(seconds=gap_timeout_seconds)
+    changes: list[UserChange] = []
+    next_id = after_id + 1
+    for change, database_now in result.tuples():
+        if change.id != next_id and database_now - change.created_at < gap_timeout:
+            break
+        changes.append(change)
+        next_id = change.id + 1
+    return changes
+
+
+def to_change_event(shard: int, change: UserChange) -> UserChangeEvent:
+    return UserChangeEvent(
+        shard=shard,
+        offset=change.id,
+        id=encode_external_id(change.external_id),
+        change_type=change.change_type,
+        version=change.version,
+        first_name=change.first_name,
+        last_name=change.last_name,
+        birthday=change.birthday,
+        created_at=change.created_at,
+    )
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 
 from simplecrud.database.database_setup import get_session
 from simplecrud.health.common_health_checks import (
@@ -8,6 +11,8 @@ from simplecrud.health.common_health_checks import (
     mysql_response_time,
 )
 from simplecrud.health.health_checker import HealthTest, health_checker
+from simplecrud.health.profiler import is_profile_running, profile
+from simplecrud.settings import get_event_loop_monitor_settings
 
 router = APIRouter(tags=["health"])
 
@@ -21,3 +26,23 @@ async def health(async_session: AsyncSession = Depends(get_session)) -> JSONResp
         )
     ]
     return await health_checker(health_tests=health_tests)
+
+
+@router.get("/_health/profile", include_in_schema=False)
+async def profile_process(
+    seconds: Annotated[float, Query(gt=0)] = 5.0,
+    interval_ms: Annotated[float, Query(ge=1)] = 10.0,
+) -> PlainTextResponse:
+    max_seconds = get_event_loop_monitor_settings().profile_max_seconds
+    if seconds > max_seconds:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST.value,
+            detail=f"Profile can't be longer than {max_seconds} seconds",
+        )
+    if is_profile_running():
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT.value,
+            detail="Another profile is already running",
+        )
+
+    return PlainTextResponse(await profile(seconds, interval_ms / 1000))
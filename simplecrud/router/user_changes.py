@@ -0,0 +1,83 @@
+import asyncio
+import heapq
+import time
+from http import HTTPStatus
+from itertools import islice
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from simplecrud.database.model import UserChange
+from simplecrud.database.sharding import ShardSessions, get_shard_sessions
+from simplecrud.middleware.request_deadline import get_request_deadline
+from simplecrud.outbox.user_changes import fetch_changes, to_change_event
+from simplecrud.schema import UserChangeEvent, UserChangesResponse
+from simplecrud.settings import get_outbox_settings
+
+router = APIRouter(prefix="/v1/user-changes", tags=["user"])
+
+_POLL_INTERVAL_SECONDS = 0.2
+# leaves time to respond before the request deadline
+_DEADLINE_MARGIN_SECONDS = 0.5
+
+
+@router.get(path="", status_code=HTTPStatus.OK)
+async def get_user_changes(
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    offset: str | None = None,
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+    wait_seconds: Annotated[float, Query(ge=0, le=60)] = 0,
+) -> UserChangesResponse:
+    """
+    Returns user changes after the offset from the outbox of every shard.
+    With wait_seconds > 0 waits for changes (long poll) when there are none yet.
+    The returned offset is opaque, pass it back to resume after returned changes.
+    """
+    shard_offsets = parse_offset(offset, shard_sessions.shard_count)
+    wait_until = time.monotonic() + wait_seconds
+    deadline = get_request_deadline()
+    if deadline is not None:
+        wait_until = min(wait_until, deadline - _DEADLINE_MARGIN_SECONDS)
+    gap_timeout_seconds = get_outbox_settings().gap_timeout_ms / 1000
+
+    async def fetch_shard_changes(shard: int) -> list[UserChangeEvent]:
+        async with shard_sessions.session_for_shard(shard) as async_session:
+            changes: list[UserChange] = await fetch_changes(
+                async_session, shard_offsets[shard], limit, gap_timeout_seconds
+            )
+        return [to_change_event(shard, change) for change in changes]
+
+    while True:
+        shard_changes = await asyncio.gather(
+            *[fetch_shard_changes(shard) for shard in range(shard_sessions.shard_count)]
+        )
+        if any(shard_changes) or time.monotonic() >= wait_until:
+            break
+        await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+
+    changes = list(
+        islice(heapq.merge(*shard_changes, key=lambda change: change.created_at), limit)
+    )
+    for change in changes:
+        shard_offsets[change.shard] = change.offset
+    return UserChangesResponse(changes=changes, offset=format_offset(shard_offsets))
+
+
+def parse_offset(offset: str | None, shard_count: int) -> list[int]:
+    "Offset is a dot separated list of last seen change ids, one per shard"
+    shard_offsets = [0] * shard_count
+    if offset is None:
+        return shard_offsets
+    try:
+        for shard, shard_offset in enumerate(offset.split(".")[:shard_count]):
+            shard_offsets[shard] = int(shard_offset)
+    except ValueError:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST.value,
+            detail=f"Invalid offset '{offset}'",
+        )
+    return shard_offsets
+
+
+def format_offset(shard_offsets: list[int]) -> str:
+    return ".".join(str(shard_offset) for shard_offset in shard_offsets)
@@ -1,58 +1,141 @@
+import heapq
 from http import HTTPStatus
-from secrets import token_urlsafe
-from typing import Annotated, Any
+from itertools import islice
+from typing import Annotated, Any, NoReturn
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import and_, delete, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import and_, delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import Response
 
-from simplecrud.database.database_setup import get_session
-from simplecrud.database.model import User
+from simplecrud.database.model import User, UserChange
+from simplecrud.database.sharding import ShardSessions, get_shard_sessions
+from simplecrud.database.user_insert_batcher import (
+    UserInsertBatcher,
+    get_user_insert_batcher,
+)
+from simplecrud.outbox.user_changes import (
+    USER_UPDATED,
+    created_change_row,
+    deleted_change_row,
+    insert_change_from_users,
+)
 from simplecrud.schema import UpdateUserRequest
+from simplecrud.stats.user_stats import (
+    apply_stats_deltas,
+    count_user,
+    count_users,
+    new_stats_deltas,
+)
+from simplecrud.util.etag_util import etag_matches, make_etag, parse_etag_versions
+from simplecrud.util.id_util import (
+    decode_external_id,
+    encode_external_id,
+    generate_external_id,
+)
 
 router = APIRouter(prefix="/v1/users", tags=["user"])
 
 
 @router.get(
-    path="/{user_id}", response_model_exclude_none=True, status_code=HTTPStatus.OK
+    path="/{user_id}",
+    response_model=UpdateUserRequest,
+    response_model_exclude_none=True,
+    status_code=HTTPStatus.OK,
 )
 async def get_user_by_id(
-    user_id: str, async_session: Annotated[AsyncSession, Depends(get_session)]
-) -> UpdateUserRequest:
-    async with async_session.begin():
-        user = await async_session.scalar(
-            select(User).where(User.external_id == user_id)
-        )
+    user_id: str,
+    response: Response,
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> UpdateUserRequest | Response:
+    external_id = parse_user_id(user_id)
+    user = None
+    for shard in shard_sessions.user_shards(external_id):
+        async with (
+            shard_sessions.session_for_shard(shard) as async_session,
+            async_session.begin(),
+        ):
+            user = await async_session.scalar(
+                select(User).where(User.external_id == external_id)
+            )
+        if user is not None:
+            break
 
     if user is None:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND.value,
-            detail=f"User with id '{user_id}' doesn't exist",
+        raise_user_not_found(user_id)
+
+    etag = make_etag(user.version)
+    if if_none_match is not None and etag_matches(
+        if_none_match, user.version, weak_allowed=True
+    ):
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED.value, headers={"ETag": etag}
         )
 
-    return UpdateUserRequest(
-        id=user.external_id,
-        first_name=user.first_name,
-        last_name=user.last_name,
-        birthday=user.birthday,
-    )
+    response.headers["ETag"] = etag
+    return user_to_dto(user)
+
+
+@router.get(path="", response_model_exclude_none=True, status_code=HTTPStatus.OK)
+async def list_users(
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+    after: str | None = None,
+) -> list[UpdateUserRequest]:
+    """
+    Lists users ordered by id (i.e. by creation time), page by page:
+    pass the last id of the previous page as "after".
+    """
+    query = select(User).order_by(User.external_id).limit(limit)
+    if after is not None:
+        try:
+            query = query.where(User.external_id > decode_external_id(after))
+        except ValueError:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST.value,
+                detail=f"Invalid user id '{after}'",
+            )
+
+    async def fetch_users(async_session: AsyncSession) -> list[User]:
+        return list(await async_session.scalars(query))
+
+    shard_users = await shard_sessions.fan_out(fetch_users)
+    users = heapq.merge(*shard_users, key=lambda user: user.external_id)
+    return [user_to_dto(user) for user in islice(users, limit)]
 
 
 @router.post(path="", response_model_exclude_none=True, status_code=HTTPStatus.CREATED)
 async def save_user(
     user_dto: UpdateUserRequest,
-    async_session: Annotated[AsyncSession, Depends(get_session)],
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    user_insert_batcher: Annotated[
+        UserInsertBatcher | None, Depends(get_user_insert_batcher)
+    ],
 ) -> UpdateUserRequest:
-    async with async_session.begin():
-        user = User(
-            external_id=token_urlsafe(16),
-            first_name=user_dto.first_name,
-            last_name=user_dto.last_name,
-            birthday=user_dto.birthday,
-        )
+    external_id = generate_external_id()
+    user_row = {
+        "external_id": external_id,
+        "first_name": user_dto.first_name,
+        "last_name": user_dto.last_name,
+        "birthday": user_dto.birthday,
+    }
+    if user_insert_batcher is not None:
+        await user_insert_batcher.insert(user_row)
+        return UpdateUserRequest(id=encode_external_id(external_id))
+
+    async with (
+        shard_sessions.session_for(external_id) as async_session,
+        async_session.begin(),
+    ):
+        user = User(**user_row)
         async_session.add(user)
-        return UpdateUserRequest(id=user.external_id)
+        stats_deltas = new_stats_deltas()
+        count_users(stats_deltas, [user_row])
+        await apply_stats_deltas(async_session, stats_deltas)
+        # flushed on commit, after the user and statistics
+        async_session.add(UserChange(**created_change_row(user_row)))
+        return UpdateUserRequest(id=encode_external_id(user.external_id))
 
 
 @router.patch(
@@ -63,23 +146,69 @@ async def save_user(
 async def update_by_id(
     user_id: str,
     user_dto: UpdateUserRequest,
-    async_session: Annotated[AsyncSession, Depends(get_session)],
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Response:
-    async with async_session.begin():
-        user_to_update = await async_session.scalar(
-            select(User).where(User.external_id == user_id)
-        )
-        if user_to_update is None:
-            raise HTTPException(
-                status_code=HTTPStatus.NOT_FOUND.value,
-                detail=f"User with id '{user_id}' doesn't exist",
-            )
+    external_id = parse_user_id(user_id, if_match)
+    values: dict[str, Any] = {"version": User.version + 1}
+    if user_dto.first_name:
+        values["first_name"] = user_dto.first_name
+    if user_dto.last_name:
+        values["last_name"] = user_dto.last_name
+    if user_dto.birthday:
+        values["birthday"] = user_dto.birthday
 
-        user_to_update.first_name = user_dto.first_name or user_to_update.first_name
-        user_to_update.last_name = user_dto.last_name or user_to_update.last_name
-        user_to_update.birthday = user_dto.birthday or user_to_update.birthday
+    for shard in shard_sessions.user_shards(external_id):
+        async with (
+            shard_sessions.session_for_shard(shard) as async_session,
+            async_session.begin(),
+        ):
+            if await update_user_on_shard(
+                external_id, user_id, values, if_match, async_session
+            ):
+                return Response(status_code=HTTPStatus.NO_CONTENT.value)
 
-    return Response(status_code=HTTPStatus.NO_CONTENT.value)
+    raise_missing_user(user_id, if_match)
+
+
+async def update_user_on_shard(
+    external_id: bytes,
+    user_id: str,
+    values: dict[str, Any],
+    if_match: str | None,
+    async_session: AsyncSession,
+) -> bool:
+    "Returns False when the user is not on the shard of the session"
+    old_user = None
+    if "last_name" in values or "birthday" in values:
+        # statistics need the buckets the user leaves
+        old_user = await select_user_for_update(
+            user_version_condition(external_id, if_match), async_session
+        )
+    result = await async_session.execute(
+        update(User)
+        .where(user_version_condition(external_id, if_match))
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        if not await user_exists(external_id, async_session):
+            return False
+        raise_precondition_failed(user_id)
+    if old_user is not None:
+        stats_deltas = new_stats_deltas()
+        count_user(stats_deltas, old_user.birthday, old_user.last_name, -1)
+        count_user(
+            stats_deltas,
+            values.get("birthday", old_user.birthday),
+            values.get("last_name", old_user.last_name),
+            1,
+        )
+        await apply_stats_deltas(async_session, stats_deltas)
+    await async_session.execute(
+        insert_change_from_users(USER_UPDATED, User.external_id == external_id)
+    )
+    return True
 
 
 def get_not_none(arg1: Any, arg2: Any) -> Any:
@@ -94,9 +223,129 @@ def get_not_none(arg1: Any, arg2: Any) -> Any:
     status_code=HTTPStatus.NO_CONTENT,
 )
 async def delete_by_id(
-    user_id: str, async_session: Annotated[AsyncSession, Depends(get_session)]
+    user_id: str,
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Response:
-    async with async_session.begin():
-        await async_session.execute(delete(User).where(User.external_id == user_id))
+    try:
+        external_id = decode_external_id(user_id)
+    except ValueError:
+        if if_match is not None:
+            raise_missing_user(user_id, if_match)
+        return Response(status_code=HTTPStatus.NO_CONTENT.value)
+
+    deleted = False
+    for shard in shard_sessions.user_shards(external_id):
+        async with (
+            shard_sessions.session_for_shard(shard) as async_session,
+            async_session.begin(),
+        ):
+            if deleted:
+                # copies on later shards are left over from an interrupted move,
+                # they are neither counted in statistics nor recorded as changes
+                await async_session.execute(
+                    delete(User)
+                    .where(User.external_id == external_id)
+                    .execution_options(synchronize_session=False)
+                )
+            else:
+                deleted = await delete_user_on_shard(
+                    external_id, user_id, if_match, async_session
+                )
+    if not deleted and if_match is not None:
+        raise_missing_user(user_id, if_match)
 
     return Response(status_code=HTTPStatus.NO_CONTENT.value)
+
+
+async def delete_user_on_shard(
+    external_id: bytes,
+    user_id: str,
+    if_match: str | None,
+    async_session: AsyncSession,
+) -> bool:
+    "Returns False when the user is not on the shard of the session"
+    old_user = await select_user_for_update(
+        user_version_condition(external_id, if_match), async_session
+    )
+    result = await async_session.execute(
+        delete(User)
+        .where(user_version_condition(external_id, if_match))
+        .execution_options(synchronize_session=False)
+    )
+    if old_user is None or result.rowcount == 0:
+        if if_match is not None and await user_exists(external_id, async_session):
+            raise_precondition_failed(user_id)
+        return False
+
+    stats_deltas = new_stats_deltas()
+    count_user(stats_deltas, old_user.birthday, old_user.last_name, -1)
+    await apply_stats_deltas(async_session, stats_deltas)
+    await async_session.execute(insert(UserChange).values(deleted_change_row(old_user)))
+    return True
+
+
+def user_to_dto(user: User) -> UpdateUserRequest:
+    return UpdateUserRequest(
+        id=encode_external_id(user.external_id),
+        first_name=user.first_name,
+        last_name=user.last_name,
+        birthday=user.birthday,
+    )
+
+
+def parse_user_id(user_id: str, if_match: str | None = None) -> bytes:
+    try:
+        return decode_external_id(user_id)
+    except ValueError:
+        raise_missing_user(user_id, if_match)
+
+
+def user_version_condition(external_id: bytes, if_match: str | None) -> Any:
+    condition = User.external_id == external_id
+    if if_match is None:
+        return condition
+    versions = parse_etag_versions(if_match, weak_allowed=False)
+    if versions is None:
+        return condition
+    return and_(condition, User.version.in_(versions))
+
+
+async def user_exists(external_id: bytes, async_session: AsyncSession) -> bool:
+    user_db_id = await async_session.scalar(
+        select(User.id).where(User.external_id == external_id)
+    )
+    return user_db_id is not None
+
+
+async def select_user_for_update(
+    condition: Any, async_session: AsyncSession
+) -> User | None:
+    user: User | None = await async_session.scalar(
+        select(User).where(condition).with_for_update()
+    )
+    return user
+
+
+def raise_user_not_found(user_id: str) -> NoReturn:
+    raise HTTPException(
+        status_code=HTTPStatus.NOT_FOUND.value,
+        detail=f"User with id '{user_id}' doesn't exist",
+    )
+
+
+def raise_missing_user(user_id: str, if_match: str | None) -> NoReturn:
+    "If-Match never matches a missing user, see RFC 9110 section 13.1.1"
+    if if_match is None:
+        raise_user_not_found(user_id)
+    raise HTTPException(
+        status_code=HTTPStatus.PRECONDITION_FAILED.value,
+        detail=f"User with id '{user_id}' doesn't exist, ETag doesn't match",
+    )
+
+
+def raise_precondition_failed(user_id: str) -> NoReturn:
+    raise HTTPException(
+        status_code=HTTPStatus.PRECONDITION_FAILED.value,
+        detail=f"User with id '{user_id}' was modified, ETag doesn't match",
+    )
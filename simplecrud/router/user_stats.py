@@ -0,0 +1,37 @@
+from collections import defaultdict
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+
+from simplecrud.database.sharding import ShardSessions, get_shard_sessions
+from simplecrud.schema import UserStatsResponse
+from simplecrud.stats.user_stats import BIRTH_YEAR, LAST_NAME_INITIAL, fetch_user_counts
+
+router = APIRouter(prefix="/v1/user-stats", tags=["user"])
+
+
+@router.get(path="", status_code=HTTPStatus.OK)
+async def get_user_stats(
+    shard_sessions: Annotated[ShardSessions, Depends(get_shard_sessions)],
+) -> UserStatsResponse:
+    """
+    Returns user counts by birth year and by last name initial.
+    Counts are maintained by user writes, reading them doesn't scan users.
+    """
+    bucket_counts: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for shard_counts in await shard_sessions.fan_out(fetch_user_counts):
+        for (bucket_type, bucket), user_count in shard_counts.items():
+            bucket_counts[bucket_type][bucket] += user_count
+
+    def non_empty_buckets(bucket_type: str) -> dict[str, int]:
+        return {
+            bucket: user_count
+            for bucket, user_count in sorted(bucket_counts[bucket_type].items())
+            if user_count > 0
+        }
+
+    return UserStatsResponse(
+        birth_years=non_empty_buckets(BIRTH_YEAR),
+        last_name_initials=non_empty_buckets(LAST_NAME_INITIAL),
+    )
@@ -23,3 +23,31 @@ class UpdateUserRequest(BaseModel):
         return field
 
     model_config = ConfigDict(alias_generator=to_camel_case, populate_by_name=True)
+
+
+class UserChangeEvent(BaseModel):
+    shard: int
+    offset: int
+    id: str
+    change_type: str
+    version: int
+    first_name: str
+    last_name: str
+    birthday: datetime.datetime
+    created_at: datetime.datetime
+
+    model_config = ConfigDict(alias_generator=to_camel_case, populate_by_name=True)
+
+
+class UserChangesResponse(BaseModel):
+    changes: list[UserChangeEvent]
+    # pass as "offset" of the next request to resume after these changes
+    offset: str
+
+
+class UserStatsResponse(BaseModel):
+    # number of users by bucket, buckets without users are left out
+    birth_years: dict[str, int]
+    last_name_initials: dict[str, int]
+
+    model_config = ConfigDict(alias_generator=to_camel_case, populate_by_name=True)
@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,6 +14,12 @@ class AWSSettings(BaseSettings):
 
 class MySqlSettings(BaseSettings):
     url: str | None = None
+    # JSON list of shard URLs, e.g. '["mysql+aiomysql://...", ...]'; when empty
+    # the single "url" is used. Order must be kept when adding shards
+    shard_urls: list[str] = []
+    # shard count before shards were added, set until rebalancing finished:
+    # users not moved yet are served from their previous shard
+    previous_shard_count: int | None = None
     pool_size: int = 3
     max_overflow: int = 10
     model_config = SettingsConfigDict(
@@ -18,8 +27,102 @@ class MySqlSettings(BaseSettings):
     )
 
 
+class UserInsertBatchSettings(BaseSettings):
+    enabled: bool = False
+    max_size: int = 50
+    max_wait_ms: float = 5.0
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="user_insert_batch_"
+    )
+
+
+class AdmissionControlSettings(BaseSettings):
+    enabled: bool = False
+    # "static" keeps limits fixed, "aimd" adapts them to pool wait time
+    mode: Literal["static", "aimd"] = "static"
+    read_limit: int = 20
+    write_limit: int = 10
+    # long polls of the change stream mostly sleep, they get their own fixed
+    # limit so that waiting consumers don't use up the read limit
+    stream_limit: int = 50
+    min_limit: int = 1
+    max_limit: int = 100
+    pool_wait_target_ms: float = 50.0
+    backoff_ratio: float = 0.9
+    retry_after_seconds: int = 1
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="admission_control_"
+    )
+
+
+class RequestDeadlineSettings(BaseSettings):
+    enabled: bool = False
+    default_ms: int = 10_000
+    max_ms: int = 30_000
+    # lets clients ask for any deadline, shorter or longer than default_ms, up to max_ms
+    header: str = "X-Request-Timeout-Ms"
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="request_deadline_"
+    )
+
+
+class EventLoopMonitorSettings(BaseSettings):
+    enabled: bool = True
+    interval_ms: float = 100.0
+    block_threshold_ms: float = 500.0
+    profile_max_seconds: float = 60.0
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="event_loop_monitor_"
+    )
+
+
+class OutboxSettings(BaseSettings):
+    relay_enabled: bool = False
+    # required with the relay, "memory" keeps only the latest changes and is
+    # meant for tests and local runs
+    sink: Literal["memory", "file"] | None = None
+    file_sink_path: str = "user_changes.jsonl"
+    batch_size: int = 100
+    poll_interval_ms: float = 500.0
+    # readers don't pass a gap in change ids younger than this: a transaction
+    # which got the missing id may still be committing
+    gap_timeout_ms: float = 5_000.0
+    # changes older than the retention are deleted once the relay, when enabled,
+    # published them; change stream readers can't resume from pruned offsets
+    prune_enabled: bool = True
+    retention_days: float = 7.0
+    prune_interval_seconds: float = 3_600.0
+    prune_batch_size: int = 1_000
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="outbox_"
+    )
+
+    @model_validator(mode="after")
+    def check_sink_is_set(self) -> "OutboxSettings":
+        if self.relay_enabled and self.sink is None:
+            raise ValueError("OUTBOX_SINK must be set when the relay is enabled")
+        return self
+
+
+class UserStatsSettings(BaseSettings):
+    # counters of a bucket are split into slots picked at random by each write,
+    # so concurrent writes to a popular bucket rarely wait for the same row lock
+    slots: int = 8
+    reconcile_enabled: bool = True
+    reconcile_interval_seconds: float = 3_600.0
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", env_prefix="user_stats_"
+    )
+
+
 _aws_settings: AWSSettings | None = None
 _mysql_settings: MySqlSettings | None = None
+_user_insert_batch_settings: UserInsertBatchSettings | None = None
+_admission_control_settings: AdmissionControlSettings | None = None
+_request_deadline_settings: RequestDeadlineSettings | None = None
+_event_loop_monitor_settings: EventLoopMonitorSettings | None = None
+_outbox_settings: OutboxSettings | None = None
+_user_stats_settings: UserStatsSettings | None = None
 
 
 def get_aws_settings() -> AWSSettings:
@@ -34,3 +137,45 @@ def get_mysql_settings() -> MySqlSettings:
     if _mysql_settings is None:
         _mysql_settings = MySqlSettings()
     return _mysql_settings
+
+
+def get_user_insert_batch_settings() -> UserInsertBatchSettings:
+    global _user_insert_batch_settings
+    if _user_insert_batch_settings is None:
+        _user_insert_batch_settings = UserInsertBatchSettings()
+    return _user_insert_batch_settings
+
+
+def get_admission_control_settings() -> AdmissionControlSettings:
+    global _admission_control_settings
+    if _admission_control_settings is None:
+        _admission_control_settings = AdmissionControlSettings()
+    return _admission_control_settings
+
+
+def get_request_deadline_settings() -> RequestDeadlineSettings:
+    global _request_deadline_settings
+    if _request_deadline_settings is None:
+        _request_deadline_settings = RequestDeadlineSettings()
+    return _request_deadline_settings
+
+
+def get_event_loop_monitor_settings() -> EventLoopMonitorSettings:
+    global _event_loop_monitor_settings
+    if _event_loop_monitor_settings is None:
+        _event_loop_monitor_settings = EventLoopMonitorSettings()
+    return _event_loop_monitor_settings
+
+
+def get_outbox_settings() -> OutboxSettings:
+    global _outbox_settings
+    if _outbox_settings is None:
+        _outbox_settings = OutboxSettings()
+    return _outbox_settings
+
+
+def get_user_stats_settings() -> UserStatsSettings:
+    global _user_stats_settings
+    if _user_stats_settings is None:
+        _user_stats_settings = UserStatsSettings()
+    return _user_stats_settings
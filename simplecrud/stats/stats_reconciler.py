@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Sequence
+
+from aioprometheus.collectors import Counter
+from sqlalchemy import ColumnElement, Insert, extract, func, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from simplecrud.database.database_setup import get_shard_session_makers
+from simplecrud.database.model import User, UserStatReconcile
+from simplecrud.database.sql_functions import utc_now
+from simplecrud.jobsimulation.job_processor import cancel_job_processor
+from simplecrud.settings import get_user_stats_settings
+from simplecrud.stats.user_stats import (
+    BIRTH_YEAR,
+    LAST_NAME_INITIAL,
+    StatsDeltas,
+    apply_stats_deltas,
+    fetch_user_counts,
+    last_name_initial,
+    new_stats_deltas,
+)
+
+RECONCILE_LOCK_NAME = "user_stat"
+
+log = logging.getLogger(__name__)
+
+_corrected_buckets_counter = Counter(
+    "user_stats_corrected_buckets",
+    "User statistics buckets whose count drifted from the user table",
+)
+
+
+async def reconcile_shard(
+    session_maker: async_sessionmaker[AsyncSession], min_interval_seconds: float = 0
+) -> int:
+    """
+    Corrects user statistics of one shard to match the user table, unless
+    another reconcile finished less than min_interval_seconds ago.
+    Counting users and reading statistics in one REPEATABLE READ transaction
+    sees both at the same snapshot, so the difference is added without blocking
+    writers: changes committed in the meantime update the counts on their own.
+    Reconciles of a shard are serialized by a lock row, taken before the snapshot
+    is started by the first plain read, so each one sees the corrections of
+    the previous one. Returns number of corrected buckets.
+    """
+    async with session_maker() as session, session.begin():
+        dialect_name = session.get_bind().dialect.name
+        await session.execute(insert_reconcile_lock_if_missing(dialect_name))
+
+    async with session_maker() as session, session.begin():
+        if dialect_name == "mysql":
+            await session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+        reconcile, database_now = (
+            await session.execute(
+                select(UserStatReconcile, utc_now())
+                .where(UserStatReconcile.name == RECONCILE_LOCK_NAME)
+                .with_for_update()
+            )
+        ).one()
+        if (
+            reconcile.reconciled_at is not None
+            and database_now - reconcile.reconciled_at
+            < datetime.timedelta(seconds=min_interval_seconds)
+        ):
+            log.info("User stats were reconciled recently, skipping")
+            return 0
+
+        birth_year = extract("year", User.birthday)
+        initial: ColumnElement[str] = func.substr(User.last_name, 1, 1)
+        if dialect_name == "mysql":
+            # the default collation would group "e", "E" and "É" together
+            initial = initial.collate("utf8mb4_bin")
+        user_groups = await session.execute(
+            select(birth_year, initial, func.count()).group_by(birth_year, initial)
+        )
+        drift: StatsDeltas = new_stats_deltas()
+        for year, initial_letter, user_count in user_groups.tuples():
+            drift[(BIRTH_YEAR, str(year))] += user_count
+            drift[(LAST_NAME_INITIAL, last_name_initial(initial_letter))] += user_count
+        for bucket, user_count in (await fetch_user_counts(session)).items():
+            drift[bucket] -= user_count
+
+        corrected_count = sum(1 for change in drift.values() if change != 0)
+        await apply_stats_deltas(session, drift, slot=0)
+        reconcile.reconciled_at = database_now
+    return corrected_count
+
+
+def insert_reconcile_lock_if_missing(dialect_name: str) -> Insert:
+    values = {"name": RECONCILE_LOCK_NAME, "reconciled_at": None}
+    if dialect_name == "sqlite":
+        return sqlite.insert(UserStatReconcile).values(values).on_conflict_do_nothing()
+    return mysql.insert(UserStatReconcile).values(values).prefix_with("IGNORE")
+
+
+async def reconcile_user_stats(
+    session_makers: Sequence[async_sessionmaker[AsyncSession]],
+    min_interval_seconds: float = 0,
+) -> int:
+    corrected_count = 0
+    for shard, session_maker in enumerate(session_makers):
+        shard_corrected_count = await reconcile_shard(
+            session_maker, min_interval_seconds
+        )
+        if shard_corrected_count > 0:
+            log.warning(
+                f"Corrected {shard_corrected_count} user stats buckets on shard {shard}"
+            )
+            _corrected_buckets_counter.add({"shard": str(shard)}, shard_corrected_count)
+        corrected_count += shard_corrected_count
+    return corrected_count
+
+
+async def stats_reconciler(interval_seconds: float) -> None:
+    """
+    Reconciles at startup, which also builds statistics of a new table.
+    Shards reconciled by another instance within the interval are skipped,
+    so instances started together don't all scan the user table.
+    """
+    while True:
+        try:
+            await reconcile_user_stats(get_shard_session_makers(), interval_seconds)
+            await asyncio.sleep(interval_seconds)
+        except asyncio.CancelledError:
+            log.info("stats_reconciler: cancelled")
+            raise
+        except Exception:
+            log.exception("Exception raised by user stats reconciler")
+            await asyncio.sleep(60)
+
+
+@asynccontextmanager
+async def generate_stats_reconciler() -> AsyncGenerator[None, None]:
+    settings = get_user_stats_settings()
+    if not settings.reconcile_enabled:
+        yield
+        return
+
+    # a reconcile transaction rolls back when cancelled, so no graceful wait
+    stats_reconciler_task = asyncio.create_task(
+        stats_reconciler(settings.reconcile_interval_seconds)
+    )
+    try:
+        yield
+    finally:
+        log.info("Stopping user stats reconciler")
+        await cancel_job_processor(stats_reconciler_task)
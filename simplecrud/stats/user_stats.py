@@ -0,0 +1,98 @@
+import datetime
+import random
+from collections import defaultdict
+from typing import Any, Iterable
+
+from sqlalchemy import Insert, func, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from simplecrud.database.model import UserStat
+from simplecrud.settings import get_user_stats_settings
+
+BIRTH_YEAR = "birth_year"
+LAST_NAME_INITIAL = "last_name_initial"
+
+Bucket = tuple[str, str]
+StatsDeltas = defaultdict[Bucket, int]
+
+
+def new_stats_deltas() -> StatsDeltas:
+    return defaultdict(int)
+
+
+def user_buckets(birthday: datetime.datetime, last_name: str) -> list[Bucket]:
+    return [
+        (BIRTH_YEAR, str(birthday.year)),
+        (LAST_NAME_INITIAL, last_name_initial(last_name)),
+    ]
+
+
+def last_name_initial(last_name: str) -> str:
+    return last_name[:1].upper()
+
+
+def count_user(
+    deltas: StatsDeltas, birthday: datetime.datetime, last_name: str, change: int
+) -> None:
+    for bucket in user_buckets(birthday, last_name):
+        deltas[bucket] += change
+
+
+def count_users(deltas: StatsDeltas, user_rows: Iterable[dict[str, Any]]) -> None:
+    for user_row in user_rows:
+        count_user(deltas, user_row["birthday"], user_row["last_name"], 1)
+
+
+async def apply_stats_deltas(
+    async_session: AsyncSession, deltas: StatsDeltas, slot: int | None = None
+) -> None:
+    """
+    Adds deltas to the user counts in the caller's transaction,
+    so statistics commit or roll back together with the user change.
+    Buckets are updated in a fixed order to avoid deadlocks between writers.
+    """
+    if slot is None:
+        slot = random.randrange(get_user_stats_settings().slots)
+    rows = [
+        {
+            "bucket_type": bucket_type,
+            "bucket": bucket,
+            "slot": slot,
+            "user_count": change,
+        }
+        for (bucket_type, bucket), change in sorted(deltas.items())
+        if change != 0
+    ]
+    if rows:
+        dialect_name = async_session.get_bind().dialect.name
+        await async_session.execute(upsert_user_counts(dialect_name), rows)
+
+
+def upsert_user_counts(dialect_name: str) -> Insert:
+    "Inserts missing buckets and increments existing ones"
+    if dialect_name == "sqlite":
+        sqlite_insert = sqlite.insert(UserStat)
+        return sqlite_insert.on_conflict_do_update(
+            index_elements=[UserStat.bucket_type, UserStat.bucket, UserStat.slot],
+            set_={
+                "user_count": UserStat.user_count + sqlite_insert.excluded.user_count
+            },
+        )
+    mysql_insert = mysql.insert(UserStat)
+    return mysql_insert.on_duplicate_key_update(
+        user_count=UserStat.user_count + mysql_insert.inserted.user_count
+    )
+
+
+async def fetch_user_counts(async_session: AsyncSession) -> dict[Bucket, int]:
+    "Reads counts of every bucket, cost depends on number of buckets only"
+    result = await async_session.execute(
+        select(
+            UserStat.bucket_type, UserStat.bucket, func.sum(UserStat.user_count)
+        ).group_by(UserStat.bucket_type, UserStat.bucket)
+    )
+    return {
+        (bucket_type, bucket): int(user_count)
+        for bucket_type, bucket, user_count in result.tuples()
+    }
@@ -0,0 +1,32 @@
+WILDCARD = "*"
+
+
+def make_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_etag_versions(header: str, weak_allowed: bool) -> list[int] | None:
+    """
+    Parses If-Match / If-None-Match header value into list of versions.
+    Returns None when header is a wildcard ("*").
+    Weak ETags are skipped unless weak_allowed is True (If-Match uses strong comparison).
+    """
+    if header.strip() == WILDCARD:
+        return None
+
+    versions: list[int] = []
+    for raw_etag in header.split(","):
+        etag = raw_etag.strip()
+        if etag.startswith("W/"):
+            if not weak_allowed:
+                continue
+            etag = etag[2:]
+        etag = etag.strip('"')
+        if etag.isdigit():
+            versions.append(int(etag))
+    return versions
+
+
+def etag_matches(header: str, version: int, weak_allowed: bool) -> bool:
+    versions = parse_etag_versions(header, weak_allowed)
+    return versions is None or version in versions
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import secrets
+import time
+
+EXTERNAL_ID_BYTES = 16
+
+# Crockford's base32: sortable, case-insensitive, no ambiguous letters
+_BASE32_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_BASE32_VALUES = {char: value for value, char in enumerate(_BASE32_ALPHABET)}
+_ENCODED_LENGTH = 26
+# ids generated by token_urlsafe(16) before switching to binary ids
+_LEGACY_ENCODED_LENGTH = 22
+
+
+def generate_external_id() -> bytes:
+    """
+    Generates 128-bit time-ordered id with UUIDv7 layout:
+    48 bits of unix time in ms, 4 bits version, 12 bits of sub-ms time,
+    2 bits variant and 62 random bits.
+    """
+    timestamp_ns = time.time_ns()
+    timestamp_ms, remainder_ns = divmod(timestamp_ns, 1_000_000)
+    sub_ms = remainder_ns * 4096 // 1_000_000
+    value = (
+        (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | sub_ms << 64
+        | 0b10 << 62
+        | secrets.randbits(62)
+    )
+    return value.to_bytes(EXTERNAL_ID_BYTES, "big")
+
+
+def encode_external_id(external_id: bytes) -> str:
+    value = int.from_bytes(external_id, "big")
+    chars = []
+    for _ in range(_ENCODED_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(_BASE32_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def decode_external_id(encoded: str) -> bytes:
+    """
+    Decodes external id from its string representation.
+    Legacy token_urlsafe(16) ids are accepted as well, they map to the same 16 bytes
+    which were stored by migration.
+    Raises ValueError if the string is not a valid external id.
+    """
+    if len(encoded) == _LEGACY_ENCODED_LENGTH:
+        try:
+            legacy_id = base64.urlsafe_b64decode(encoded + "==")
+        except binascii.Error as e:
+            raise ValueError(f"Invalid external id: {encoded!r}") from e
+        if len(legacy_id) != EXTERNAL_ID_BYTES:
+            raise ValueError(f"Invalid external id: {encoded!r}")
+        return legacy_id
+
+    if len(encoded) != _ENCODED_LENGTH:
+        raise ValueError(f"Invalid external id: {encoded!r}")
+
+    value = 0
+    for char in encoded.upper():
+        if char not in _BASE32_VALUES:
+            raise ValueError(f"Invalid external id: {encoded!r}")
+        value = value * 32 + _BASE32_VALUES[char]
+    if value >= 1 << (EXTERNAL_ID_BYTES * 8):
+        raise ValueError(f"Invalid external id: {encoded!r}")
+    return value.to_bytes(EXTERNAL_ID_BYTES, "big")
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from http import HTTPStatus
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from simplecrud.middleware.admission_control import (
+    AdmissionControlMiddleware,
+    AimdConcurrencyLimiter,
+)
+from simplecrud.settings import AdmissionControlSettings
+
+
+def generate_app(release_requests: asyncio.Event) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        settings=AdmissionControlSettings(read_limit=1, retry_after_seconds=3),
+    )
+
+    @app.get("/slow")
+    async def slow() -> None:
+        await release_requests.wait()
+
+    @app.get("/v1/user-changes")
+    async def slow_stream() -> None:
+        await release_requests.wait()
+
+    @app.get("/_health/slow")
+    async def slow_health() -> None:
+        await release_requests.wait()
+
+    return app
+
+
+class TestAdmissionControl(unittest.IsolatedAsyncioTestCase):
+    async def test_sheds_requests_over_limit(self) -> None:
+        release_requests = asyncio.Event()
+        async with AsyncClient(
+            app=generate_app(release_requests), base_url="http://test"
+        ) as client:
+            admitted_request = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.1)
+
+            shed_response = await client.get("/slow")
+
+            release_requests.set()
+            admitted_response = await admitted_request
+
+        self.assertEqual(HTTPStatus.SERVICE_UNAVAILABLE, shed_response.status_code)
+        self.assertEqual("3", shed_response.headers["Retry-After"])
+        self.assertEqual(HTTPStatus.OK, admitted_response.status_code)
+
+    async def test_health_routes_are_exempt(self) -> None:
+        release_requests = asyncio.Event()
+        async with AsyncClient(
+            app=generate_app(release_requests), base_url="http://test"
+        ) as client:
+            requests = [
+                asyncio.create_task(client.get("/_health/slow")) for _ in range(3)
+            ]
+            await asyncio.sleep(0.1)
+            release_requests.set()
+            responses = await asyncio.gather(*requests)
+
+        for response in responses:
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+    async def test_long_polls_have_own_limit(self) -> None:
+        release_requests = asyncio.Event()
+        async with AsyncClient(
+            app=generate_app(release_requests), base_url="http://test"
+        ) as client:
+            long_polls = [
+                asyncio.create_task(client.get("/v1/user-changes")) for _ in range(3)
+            ]
+            await asyncio.sleep(0.1)
+            read_request = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.1)
+            release_requests.set()
+            responses = await asyncio.gather(read_request, *long_polls)
+
+        for response in responses:
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+    def test_aimd_limit(self) -> None:
+        limiter = AimdConcurrencyLimiter(
+            "read",
+            limit=10,
+            min_limit=2,
+            max_limit=11,
+            pool_wait_target_seconds=0.05,
+            backoff_ratio=0.5,
+        )
+
+        self.assertTrue(limiter.try_acquire())
+        limiter.release(pool_wait_seconds=0.01)
+        self.assertAlmostEqual(10.1, limiter.limit)
+
+        for _ in range(3):
+            self.assertTrue(limiter.try_acquire())
+            limiter.release(pool_wait_seconds=1)
+        self.assertEqual(2, limiter.limit)
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+import unittest
+from http import HTTPStatus
+
+from fastapi.testclient import TestClient
+
+from main import app
+from simplecrud.health.event_loop_monitor import (
+    BlockedEventLoopWatchdog,
+    monitor_event_loop_lag,
+)
+
+client = TestClient(app=app)
+
+
+class TestHealth(unittest.IsolatedAsyncioTestCase):
+    async def test_profile(self) -> None:
+        response = client.get("/_health/profile?seconds=0.2&interval_ms=5")
+
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        stacks = response.text.splitlines()
+        self.assertTrue(len(stacks) > 0)
+        for stack in stacks:
+            frames, count = stack.rsplit(" ", 1)
+            self.assertTrue(int(count) > 0)
+            self.assertNotIn("sampling-profiler", frames)
+
+    async def test_profile_too_long(self) -> None:
+        response = client.get("/_health/profile?seconds=3600")
+
+        self.assertEqual(HTTPStatus.BAD_REQUEST, response.status_code)
+
+    async def test_blocked_event_loop_is_logged(self) -> None:
+        watchdog = BlockedEventLoopWatchdog(
+            threading.get_ident(), interval_seconds=0.01, block_threshold_seconds=0.1
+        )
+        watchdog.start()
+        monitor_task = asyncio.create_task(monitor_event_loop_lag(0.01, watchdog))
+        try:
+            with self.assertLogs(
+                "simplecrud.health.event_loop_monitor", level="WARNING"
+            ) as logs:
+                await asyncio.sleep(0.05)
+                time.sleep(0.5)
+        finally:
+            monitor_task.cancel()
+            await asyncio.to_thread(watchdog.stop)
+
+        self.assertIn("Event loop blocked", logs.output[0])
+        self.assertIn(
+            "test_blocked_event_loop_is_logged",
+            logs.records[0].__dict__["blocked_stack"],
+        )
@@ -0,0 +1,39 @@
+import base64
+import secrets
+import unittest
+
+from simplecrud.util.id_util import (
+    decode_external_id,
+    encode_external_id,
+    generate_external_id,
+)
+
+
+class TestIdUtil(unittest.TestCase):
+    def test_generated_ids_are_time_ordered(self) -> None:
+        external_ids = [generate_external_id() for _ in range(100)]
+        encoded_ids = [encode_external_id(external_id) for external_id in external_ids]
+
+        self.assertEqual(16, len(external_ids[0]))
+        self.assertEqual(26, len(encoded_ids[0]))
+        self.assertEqual(sorted(external_ids), external_ids)
+        self.assertEqual(sorted(encoded_ids), encoded_ids)
+
+    def test_encode_decode_round_trip(self) -> None:
+        external_id = generate_external_id()
+        encoded_id = encode_external_id(external_id)
+
+        self.assertEqual(external_id, decode_external_id(encoded_id))
+        self.assertEqual(external_id, decode_external_id(encoded_id.lower()))
+
+    def test_decode_legacy_id(self) -> None:
+        legacy_id = secrets.token_urlsafe(16)
+
+        self.assertEqual(
+            base64.urlsafe_b64decode(legacy_id + "=="), decode_external_id(legacy_id)
+        )
+
+    def test_decode_invalid_id(self) -> None:
+        for invalid_id in ["123", "user-1", "Z" * 26, "U" * 26, "!" * 22]:
+            with self.assertRaises(ValueError):
+                decode_external_id(invalid_id)
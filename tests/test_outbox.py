@@ -0,0 +1,279 @@
+import datetime
+import unittest
+from http import HTTPStatus
+from typing import Any
+
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from sqlalchemy import event, insert, select
+
+from main import app
+from simplecrud.database.model import OutboxRelayOffset, UserChange
+from simplecrud.database.sharding import get_shard_sessions
+from simplecrud.outbox.change_sink import InMemoryChangeSink
+from simplecrud.outbox.outbox_pruner import prune_shard
+from simplecrud.outbox.outbox_relay import RELAY_NAME, relay_shard
+from simplecrud.outbox.user_changes import fetch_changes
+from simplecrud.settings import OutboxSettings
+from tests import test_user_crud
+from tests.test_user_crud import generate_async_engine, override_get_shard_sessions
+
+client = TestClient(app=app)
+
+
+def change_row(change_id: int, created_at: datetime.datetime) -> dict[str, Any]:
+    return {
+        "id": change_id,
+        "external_id": b"0" * 16,
+        "change_type": "created",
+        "version": 1,
+        "first_name": "first",
+        "last_name": "last",
+        "birthday": created_at,
+        "created_at": created_at,
+    }
+
+
+def create_update_delete_user() -> str:
+    user_id: str = client.post(
+        "/v1/users",
+        json={
+            "firstName": "first",
+            "lastName": "last",
+            "birthday": "2023-10-25T10:45:20",
+        },
+    ).json()["id"]
+    client.patch(f"/v1/users/{user_id}", json={"firstName": "updated"})
+    client.delete(f"/v1/users/{user_id}")
+    return user_id
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        app.dependency_overrides[get_shard_sessions] = override_get_shard_sessions
+
+    async def test_changes_are_recorded(self) -> None:
+        async with generate_async_engine():
+            create_update_delete_user()
+
+            async with test_user_crud._async_session_maker() as session:
+                changes = list(
+                    await session.scalars(select(UserChange).order_by(UserChange.id))
+                )
+
+        self.assertEqual(
+            [
+                ("created", 1, "first"),
+                ("updated", 2, "updated"),
+                ("deleted", 2, "updated"),
+            ],
+            [
+                (change.change_type, change.version, change.first_name)
+                for change in changes
+            ],
+        )
+
+    async def test_failed_update_is_not_recorded(self) -> None:
+        async with generate_async_engine():
+            user_id = client.post(
+                "/v1/users",
+                json={
+                    "firstName": "first",
+                    "lastName": "last",
+                    "birthday": "2023-10-25T10:45:20",
+                },
+            ).json()["id"]
+            response = client.patch(
+                f"/v1/users/{user_id}",
+                json={"firstName": "updated"},
+                headers={"If-Match": '"5"'},
+            )
+            self.assertEqual(HTTPStatus.PRECONDITION_FAILED, response.status_code)
+
+            async with test_user_crud._async_session_maker() as session:
+                change_types = list(
+                    await session.scalars(select(UserChange.change_type))
+                )
+
+        self.assertEqual(["created"], change_types)
+
+    async def test_relay_publishes_changes_once(self) -> None:
+        async with generate_async_engine():
+            user_id = create_update_delete_user()
+            sink = InMemoryChangeSink()
+
+            first_published = await relay_shard(
+                0, test_user_crud._async_session_maker, sink, 2, 0
+            )
+            second_published = await relay_shard(
+                0, test_user_crud._async_session_maker, sink, 2, 0
+            )
+            third_published = await relay_shard(
+                0, test_user_crud._async_session_maker, sink, 2, 0
+            )
+
+            async with test_user_crud._async_session_maker() as session:
+                relay_offset = await session.scalar(
+                    select(OutboxRelayOffset.last_id).where(
+                        OutboxRelayOffset.name == RELAY_NAME
+                    )
+                )
+
+        self.assertEqual(
+            [2, 1, 0], [first_published, second_published, third_published]
+        )
+        self.assertEqual(3, relay_offset)
+        self.assertEqual(
+            ["created", "updated", "deleted"],
+            [change.change_type for change in sink.changes],
+        )
+        self.assertTrue(all(change.id == user_id for change in sink.changes))
+
+    async def test_get_user_changes_resumes_from_offset(self) -> None:
+        async with generate_async_engine():
+            create_update_delete_user()
+
+            first_page = client.get("/v1/user-changes?limit=2").json()
+            second_page = client.get(
+                f"/v1/user-changes?offset={first_page['offset']}"
+            ).json()
+            long_poll_response = client.get(
+                f"/v1/user-changes?offset={second_page['offset']}&wait_seconds=0.3"
+            )
+
+        self.assertEqual(
+            ["created", "updated"],
+            [change["changeType"] for change in first_page["changes"]],
+        )
+        self.assertEqual(
+            ["deleted"], [change["changeType"] for change in second_page["changes"]]
+        )
+        self.assertEqual(HTTPStatus.OK, long_poll_response.status_code)
+        self.assertEqual([], long_poll_response.json()["changes"])
+        self.assertEqual("3", long_poll_response.json()["offset"])
+
+    async def test_get_user_changes_invalid_offset(self) -> None:
+        async with generate_async_engine():
+            response = client.get("/v1/user-changes?offset=abc")
+
+        self.assertEqual(HTTPStatus.BAD_REQUEST, response.status_code)
+
+    async def test_outbox_insert_is_last_statement(self) -> None:
+        async with generate_async_engine():
+            statements: list[str] = []
+
+            def record_statement(
+                _connection: Any, _cursor: Any, statement: str, *_: Any
+            ) -> None:
+                statements.append(statement.strip().upper())
+
+            def record_commit(_connection: Any) -> None:
+                statements.append("COMMIT")
+
+            engine = test_user_crud._override_engine.sync_engine
+            event.listen(engine, "before_cursor_execute", record_statement)
+            event.listen(engine, "commit", record_commit)
+
+            user_id = client.post(
+                "/v1/users",
+                json={
+                    "firstName": "first",
+                    "lastName": "last",
+                    "birthday": "2023-10-25T10:45:20",
+                },
+            ).json()["id"]
+            client.patch(f"/v1/users/{user_id}", json={"lastName": "updated"})
+            client.delete(f"/v1/users/{user_id}")
+
+        last_statements = [
+            statements[i - 1]
+            for i, statement in enumerate(statements)
+            if statement == "COMMIT"
+        ]
+        self.assertEqual(3, len(last_statements))
+        for statement in last_statements:
+            self.assertTrue(statement.startswith("INSERT INTO USER_CHANGE"), statement)
+
+    async def test_fetch_changes_waits_for_recent_gap(self) -> None:
+        now = datetime.datetime.utcnow()
+
+        async with generate_async_engine():
+            async with test_user_crud._async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(
+                        insert(UserChange),
+                        [change_row(1, now), change_row(3, now)],
+                    )
+                before_gap = await fetch_changes(session, 0, 10, 5)
+                at_gap = await fetch_changes(session, 1, 10, 5)
+                past_timeout = await fetch_changes(session, 1, 10, 0)
+
+        self.assertEqual([1], [change.id for change in before_gap])
+        self.assertEqual([], at_gap)
+        self.assertEqual([3], [change.id for change in past_timeout])
+
+    async def test_prune_keeps_recent_and_unpublished_changes(self) -> None:
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=8)
+        recent = datetime.datetime.utcnow() - datetime.timedelta(days=6)
+
+        async with generate_async_engine():
+            async with test_user_crud._async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(
+                        insert(UserChange),
+                        [
+                            change_row(1, old),
+                            change_row(2, old),
+                            change_row(3, old),
+                            change_row(4, recent),
+                        ],
+                    )
+                    session.add(OutboxRelayOffset(name=RELAY_NAME, last_id=2))
+
+            relay_pruned_count = await prune_shard(
+                test_user_crud._async_session_maker, 7, 1, relay_enabled=True
+            )
+            async with test_user_crud._async_session_maker() as session:
+                relay_kept_ids = list(await session.scalars(select(UserChange.id)))
+
+            pruned_count = await prune_shard(
+                test_user_crud._async_session_maker, 7, 1, relay_enabled=False
+            )
+            async with test_user_crud._async_session_maker() as session:
+                kept_ids = list(await session.scalars(select(UserChange.id)))
+
+        self.assertEqual(2, relay_pruned_count)
+        self.assertEqual([3, 4], relay_kept_ids)
+        self.assertEqual(1, pruned_count)
+        self.assertEqual([4], kept_ids)
+
+    async def test_prune_waits_for_first_relay_offset(self) -> None:
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=8)
+
+        async with generate_async_engine():
+            async with test_user_crud._async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(insert(UserChange), [change_row(1, old)])
+
+            pruned_count = await prune_shard(
+                test_user_crud._async_session_maker, 7, 10, relay_enabled=True
+            )
+
+        self.assertEqual(0, pruned_count)
+
+    async def test_in_memory_sink_keeps_latest_changes(self) -> None:
+        async with generate_async_engine():
+            create_update_delete_user()
+            sink = InMemoryChangeSink(max_size=2)
+
+            await relay_shard(0, test_user_crud._async_session_maker, sink, 10, 0)
+
+        self.assertEqual(
+            ["updated", "deleted"], [change.change_type for change in sink.changes]
+        )
+
+    def test_relay_requires_sink(self) -> None:
+        with self.assertRaises(ValidationError):
+            OutboxSettings(relay_enabled=True)
+
+        self.assertEqual("file", OutboxSettings(relay_enabled=True, sink="file").sink)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+import unittest
+from http import HTTPStatus
+from typing import Annotated, Any, cast
+
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient
+from sqlalchemy import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+from simplecrud.database.database_setup import (
+    DEADLINE_SESSION_INFO_KEY,
+    apply_statement_timeout,
+    generate_async_engine,
+    get_session,
+)
+from simplecrud.middleware.request_deadline import (
+    RequestDeadlineMiddleware,
+    get_request_deadline,
+)
+from simplecrud.settings import (
+    RequestDeadlineSettings,
+    get_mysql_settings,
+    get_request_deadline_settings,
+)
+
+
+def generate_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        RequestDeadlineMiddleware,
+        settings=RequestDeadlineSettings(default_ms=1_000, max_ms=2_000),
+    )
+
+    @app.get("/slow")
+    async def slow() -> None:
+        await asyncio.sleep(5)
+
+    @app.get("/remaining")
+    async def remaining() -> float:
+        deadline = get_request_deadline()
+        return -1 if deadline is None else deadline - time.monotonic()
+
+    @app.get("/session-deadline")
+    async def session_deadline(
+        session: Annotated[AsyncSession, Depends(get_session)],
+    ) -> float:
+        deadline = session.info[DEADLINE_SESSION_INFO_KEY]
+        return -1 if deadline is None else deadline - time.monotonic()
+
+    return app
+
+
+class StubDialect:
+    name = "mysql"
+
+
+class StubConnection:
+    "Records SQL sent by the after_begin listener"
+
+    dialect = StubDialect()
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+        self.info: dict[str, Any] = {}
+
+    def exec_driver_sql(self, statement: str) -> None:
+        self.statements.append(statement)
+
+
+def run_statement_timeout_listener(
+    deadline: float | None, connection: StubConnection | None = None
+) -> list[str]:
+    session = Session()
+    session.info[DEADLINE_SESSION_INFO_KEY] = deadline
+    connection = connection or StubConnection()
+    apply_statement_timeout(
+        session, cast(SessionTransaction, None), cast(Connection, connection)
+    )
+    return connection.statements
+
+
+class TestRequestDeadline(unittest.IsolatedAsyncioTestCase):
+    async def test_deadline_exceeded(self) -> None:
+        async with AsyncClient(app=generate_app(), base_url="http://test") as client:
+            response = await client.get("/slow", headers={"X-Request-Timeout-Ms": "50"})
+
+        self.assertEqual(HTTPStatus.GATEWAY_TIMEOUT, response.status_code)
+        self.assertEqual(
+            "Request deadline of 50 ms exceeded", response.json()["detail"]
+        )
+
+    async def test_deadline_is_propagated(self) -> None:
+        async with AsyncClient(app=generate_app(), base_url="http://test") as client:
+            default_response = await client.get("/remaining")
+            capped_response = await client.get(
+                "/remaining", headers={"X-Request-Timeout-Ms": "60000"}
+            )
+
+        self.assertEqual(HTTPStatus.OK, default_response.status_code)
+        self.assertTrue(0 < default_response.json() <= 1)
+        self.assertTrue(1 < capped_response.json() <= 2)
+
+    async def test_deadline_is_stored_in_session(self) -> None:
+        get_mysql_settings().shard_urls = ["sqlite+aiosqlite://"]
+        try:
+            async with (
+                generate_async_engine(),
+                AsyncClient(app=generate_app(), base_url="http://test") as client,
+            ):
+                response = await client.get("/session-deadline")
+        finally:
+            get_mysql_settings().shard_urls = []
+
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        self.assertTrue(0 < response.json() <= 1)
+
+
+class TestStatementTimeout(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enabled = get_request_deadline_settings().enabled
+        get_request_deadline_settings().enabled = True
+
+    def tearDown(self) -> None:
+        get_request_deadline_settings().enabled = self.enabled
+
+    def test_remaining_time_becomes_timeouts(self) -> None:
+        statements = run_statement_timeout_listener(time.monotonic() + 2.5)
+
+        self.assertEqual(1, len(statements))
+        self.assertRegex(
+            statements[0],
+            r"^SET SESSION max_execution_time = (2500|2499), "
+            r"innodb_lock_wait_timeout = 3$",
+        )
+
+    def test_timeouts_are_reset_without_deadline(self) -> None:
+        connection = StubConnection()
+        run_statement_timeout_listener(time.monotonic() + 2.5, connection)
+        run_statement_timeout_listener(None, connection)
+        run_statement_timeout_listener(None, connection)
+
+        self.assertEqual(2, len(connection.statements))
+        self.assertEqual(
+            "SET SESSION max_execution_time = DEFAULT, "
+            "innodb_lock_wait_timeout = DEFAULT",
+            connection.statements[1],
+        )
+
+    def test_default_timeouts_are_not_set_again(self) -> None:
+        self.assertEqual([], run_statement_timeout_listener(None))
+
+    def test_same_timeouts_are_not_set_again(self) -> None:
+        connection = StubConnection()
+        # an expired deadline always leaves the shortest timeouts
+        expired_deadline = time.monotonic() - 1
+        run_statement_timeout_listener(expired_deadline, connection)
+        run_statement_timeout_listener(expired_deadline, connection)
+
+        self.assertEqual(
+            ["SET SESSION max_execution_time = 1, innodb_lock_wait_timeout = 1"],
+            connection.statements,
+        )
+
+    def test_nothing_is_set_when_disabled(self) -> None:
+        get_request_deadline_settings().enabled = False
+
+        self.assertEqual([], run_statement_timeout_listener(time.monotonic() + 1))
@@ -0,0 +1,254 @@
+import datetime
+import os
+import tempfile
+import unittest
+from http import HTTPStatus
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from main import app
+from simplecrud.database.database_setup import (
+    generate_async_engine,
+    get_shard_session_makers,
+    make_tables,
+)
+from simplecrud.database.model import User, UserChange
+from simplecrud.database.rebalance_shards import copy_users, rebalance_shards
+from simplecrud.database.sharding import (
+    get_shard_sessions,
+    jump_consistent_hash,
+    shard_for_external_id,
+)
+from simplecrud.settings import get_mysql_settings
+from simplecrud.util.id_util import (
+    decode_external_id,
+    encode_external_id,
+    generate_external_id,
+)
+
+client = TestClient(app=app)
+
+
+class TestSharding(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        app.dependency_overrides.pop(get_shard_sessions, None)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self) -> None:
+        get_mysql_settings().shard_urls = []
+        get_mysql_settings().previous_shard_count = None
+        self.tmp_dir.cleanup()
+
+    def use_sqlite_shards(self, shard_count: int) -> None:
+        get_mysql_settings().shard_urls = [
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, f'shard-{i}.db')}"
+            for i in range(shard_count)
+        ]
+
+    async def save_users_on_two_shards(self, users_count: int) -> list[bytes]:
+        self.use_sqlite_shards(2)
+        external_ids = [generate_external_id() for _ in range(users_count)]
+        async with generate_async_engine():
+            await make_tables()
+            for external_id in external_ids:
+                shard = shard_for_external_id(external_id, 2)
+                async with get_shard_session_makers()[shard]() as session:
+                    async with session.begin():
+                        session.add(
+                            User(
+                                external_id=external_id,
+                                first_name="first",
+                                last_name="last",
+                                birthday=datetime.datetime.utcnow(),
+                            )
+                        )
+        return external_ids
+
+    async def find_user_shards(self, external_id: bytes) -> list[int]:
+        shards = []
+        for shard, session_maker in enumerate(get_shard_session_makers()):
+            async with session_maker() as session:
+                if await session.scalar(
+                    select(User.id).where(User.external_id == external_id)
+                ):
+                    shards.append(shard)
+        return shards
+
+    async def test_users_are_routed_to_their_shard(self) -> None:
+        self.use_sqlite_shards(3)
+        async with generate_async_engine():
+            await make_tables()
+
+            user_ids = []
+            for i in range(20):
+                response = client.post(
+                    "/v1/users",
+                    json={
+                        "firstName": f"first-{i}",
+                        "lastName": "last",
+                        "birthday": "2023-10-25T10:45:20",
+                    },
+                )
+                self.assertEqual(HTTPStatus.CREATED, response.status_code)
+                user_ids.append(response.json()["id"])
+
+            for user_id in user_ids:
+                shard = shard_for_external_id(decode_external_id(user_id), 3)
+                async with get_shard_session_makers()[shard]() as session:
+                    saved_user = await session.scalar(
+                        select(User).where(
+                            User.external_id == decode_external_id(user_id)
+                        )
+                    )
+                self.assertIsNotNone(saved_user)
+
+                response = client.get(f"/v1/users/{user_id}")
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            first_page = client.get("/v1/users?limit=15").json()
+            second_page = client.get(
+                f"/v1/users?limit=15&after={first_page[-1]['id']}"
+            ).json()
+
+            self.assertEqual(
+                sorted(user_ids), [user["id"] for user in first_page + second_page]
+            )
+
+    async def test_rebalance_after_adding_shard(self) -> None:
+        await self.save_users_on_two_shards(50)
+
+        self.use_sqlite_shards(3)
+        async with generate_async_engine():
+            await make_tables()
+            session_makers = get_shard_session_makers()
+
+            moved_count = await rebalance_shards(session_makers, batch_size=7)
+
+            users_count = 0
+            for shard, session_maker in enumerate(session_makers):
+                async with session_maker() as session:
+                    external_ids = list(await session.scalars(select(User.external_id)))
+                for external_id in external_ids:
+                    self.assertEqual(shard, shard_for_external_id(external_id, 3))
+                users_count += len(external_ids)
+
+            self.assertEqual(50, users_count)
+            self.assertTrue(moved_count > 0)
+            self.assertEqual(0, await rebalance_shards(session_makers))
+
+            async with session_makers[2]() as session:
+                self.assertEqual(
+                    moved_count, await session.scalar(select(func.count(User.id)))
+                )
+
+    def test_jump_hash_moves_keys_only_to_new_bucket(self) -> None:
+        for key in range(1000):
+            old_bucket = jump_consistent_hash(key, 4)
+            new_bucket = jump_consistent_hash(key, 5)
+            self.assertIn(new_bucket, {old_bucket, 4})
+
+    async def test_reads_and_deletes_during_migration(self) -> None:
+        external_ids = await self.save_users_on_two_shards(60)
+        moving_ids = [
+            external_id
+            for external_id in external_ids
+            if shard_for_external_id(external_id, 3) == 2
+        ]
+        updated_id, deleted_id, copied_id = moving_ids[:3]
+
+        self.use_sqlite_shards(3)
+        get_mysql_settings().previous_shard_count = 2
+        async with generate_async_engine():
+            await make_tables()
+            session_makers = get_shard_session_makers()
+            # left over by an interrupted move: copied, not deleted from the source
+            source_shard = shard_for_external_id(copied_id, 2)
+            async with session_makers[source_shard]() as session:
+                copied_users = list(
+                    await session.scalars(
+                        select(User).where(User.external_id == copied_id)
+                    )
+                )
+            await copy_users(copied_users, session_makers[2])
+
+            get_response = client.get(f"/v1/users/{encode_external_id(updated_id)}")
+            patch_response = client.patch(
+                f"/v1/users/{encode_external_id(updated_id)}",
+                json={"firstName": "updated"},
+            )
+            client.delete(f"/v1/users/{encode_external_id(deleted_id)}")
+            client.delete(f"/v1/users/{encode_external_id(copied_id)}")
+
+            moved_count = await rebalance_shards(session_makers)
+
+            updated_user = client.get(
+                f"/v1/users/{encode_external_id(updated_id)}"
+            ).json()
+            deleted_user_shards = await self.find_user_shards(deleted_id)
+            copied_user_shards = await self.find_user_shards(copied_id)
+
+        self.assertEqual(HTTPStatus.OK, get_response.status_code)
+        self.assertEqual(HTTPStatus.NO_CONTENT, patch_response.status_code)
+        self.assertEqual(len(moving_ids) - 2, moved_count)
+        self.assertEqual("updated", updated_user["firstName"])
+        self.assertEqual([], deleted_user_shards)
+        self.assertEqual([], copied_user_shards)
+
+    async def test_delete_with_leftover_copy_is_counted_once(self) -> None:
+        self.use_sqlite_shards(2)
+        async with generate_async_engine():
+            await make_tables()
+            user_ids = [
+                client.post(
+                    "/v1/users",
+                    json={
+                        "firstName": "first",
+                        "lastName": "last",
+                        "birthday": "2023-10-25T10:45:20",
+                    },
+                ).json()["id"]
+                for _ in range(20)
+            ]
+        deleted_id = next(
+            decode_external_id(user_id)
+            for user_id in user_ids
+            if shard_for_external_id(decode_external_id(user_id), 3) == 2
+        )
+
+        self.use_sqlite_shards(3)
+        get_mysql_settings().previous_shard_count = 2
+        async with generate_async_engine():
+            await make_tables()
+            session_makers = get_shard_session_makers()
+            source_shard = shard_for_external_id(deleted_id, 2)
+            async with session_makers[source_shard]() as session:
+                deleted_users = list(
+                    await session.scalars(
+                        select(User).where(User.external_id == deleted_id)
+                    )
+                )
+            await copy_users(deleted_users, session_makers[2])
+
+            delete_response = client.delete(
+                f"/v1/users/{encode_external_id(deleted_id)}"
+            )
+
+            user_stats = client.get("/v1/user-stats").json()
+            deleted_changes = 0
+            for session_maker in session_makers:
+                async with session_maker() as session:
+                    deleted_changes += (
+                        await session.scalar(
+                            select(func.count(UserChange.id)).where(
+                                UserChange.external_id == deleted_id,
+                                UserChange.change_type == "deleted",
+                            )
+                        )
+                        or 0
+                    )
+
+        self.assertEqual(HTTPStatus.NO_CONTENT, delete_response.status_code)
+        self.assertEqual({"2023": 19}, user_stats["birthYears"])
+        self.assertEqual({"L": 19}, user_stats["lastNameInitials"])
+        self.assertEqual(1, deleted_changes)
@@ -16,6 +16,16 @@ from sqlalchemy.ext.asyncio import (
 from main import app
 from simplecrud.database.database_setup import get_session
 from simplecrud.database.model import Base, User
+from simplecrud.database.sharding import ShardSessions, get_shard_sessions
+from simplecrud.database.user_insert_batcher import (
+    UserInsertBatcher,
+    get_user_insert_batcher,
+)
+from simplecrud.util.id_util import (
+    decode_external_id,
+    encode_external_id,
+    generate_external_id,
+)
 
 client = TestClient(app=app)
 
@@ -72,10 +82,14 @@ async def override_get_session() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+async def override_get_shard_sessions() -> ShardSessions:
+    return ShardSessions([_async_session_maker])
+
+
 async def save_user(async_session: AsyncSession) -> User:
     user = User(
         id=1,
-        external_id="user-1",
+        external_id=generate_external_id(),
         first_name="first",
         last_name="last",
         birthday=datetime.datetime.utcnow(),
@@ -89,18 +103,19 @@ async def save_user(async_session: AsyncSession) -> User:
 class TestUserCrud(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self) -> None:
         app.dependency_overrides[get_session] = override_get_session
+        app.dependency_overrides[get_shard_sessions] = override_get_shard_sessions
 
     async def test_get_user_by_id(self) -> None:
         async with generate_async_engine():
             async with _async_session_maker() as session:
                 user = await save_user(session)
 
-            response = client.get(f"/v1/users/{user.external_id}")
+            response = client.get(f"/v1/users/{encode_external_id(user.external_id)}")
 
             result_user = response.json()
 
             self.assertEqual(HTTPStatus.OK, response.status_code)
-            self.assertEqual(user.external_id, result_user["id"])
+            self.assertEqual(encode_external_id(user.external_id), result_user["id"])
             self.assertEqual(user.first_name, result_user["firstName"])
             self.assertEqual(user.last_name, result_user["lastName"])
             self.assertEqual(
@@ -135,7 +150,9 @@ class TestUserCrud(unittest.IsolatedAsyncioTestCase):
 
             async with _async_session_maker() as session:
                 saved_user = await session.scalar(
-                    select(User).where(User.external_id == response.json()["id"])
+                    select(User).where(
+                        User.external_id == decode_external_id(response.json()["id"])
+                    )
                 )
 
             if saved_user is None:
@@ -148,6 +165,34 @@ class TestUserCrud(unittest.IsolatedAsyncioTestCase):
                     saved_user.birthday.strftime("%Y-%m-%dT%H:%M:%S"),
                 )
 
+    async def test_save_user_batched(self) -> None:
+        create_user_request = {
+            "first_name": "first",
+            "last_name": "last",
+            "birthday": "2023-10-25T10:45:20.895000",
+        }
+
+        async with generate_async_engine():
+            batcher = UserInsertBatcher(
+                [_async_session_maker], max_size=10, max_wait_ms=1
+            )
+            app.dependency_overrides[get_user_insert_batcher] = lambda: batcher
+            try:
+                response = client.post("/v1/users", json=create_user_request)
+            finally:
+                app.dependency_overrides.pop(get_user_insert_batcher)
+
+            self.assertEqual(HTTPStatus.CREATED, response.status_code)
+
+            async with _async_session_maker() as session:
+                saved_user = await session.scalar(
+                    select(User).where(
+                        User.external_id == decode_external_id(response.json()["id"])
+                    )
+                )
+
+            self.assertIsNotNone(saved_user)
+
     async def test_update_by_id(self) -> None:
         update_user_request_body = {"firstName": "updated", "lastName": "updated"}
         async with generate_async_engine():
@@ -155,7 +200,8 @@ class TestUserCrud(unittest.IsolatedAsyncioTestCase):
                 user = await save_user(session)
 
             response = client.patch(
-                f"/v1/users/{user.external_id}", json=update_user_request_body
+                f"/v1/users/{encode_external_id(user.external_id)}",
+                json=update_user_request_body,
             )
 
             self.assertEqual(HTTPStatus.NO_CONTENT, response.status_code)
@@ -181,7 +227,7 @@ class TestUserCrud(unittest.IsolatedAsyncioTestCase):
                 user = await save_user(session)
 
             response = client.delete(
-                f"/v1/users/{user.external_id}",
+                f"/v1/users/{encode_external_id(user.external_id)}",
             )
 
             self.assertEqual(HTTPStatus.NO_CONTENT, response.status_code)
@@ -192,3 +238,120 @@ class TestUserCrud(unittest.IsolatedAsyncioTestCase):
                 )
 
             self.assertIsNone(deleted_user)
+
+    async def test_get_user_by_id_not_modified(self) -> None:
+        async with generate_async_engine():
+            async with _async_session_maker() as session:
+                user = await save_user(session)
+
+            response = client.get(f"/v1/users/{encode_external_id(user.external_id)}")
+            etag = response.headers["ETag"]
+
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual('"1"', etag)
+
+            response = client.get(
+                f"/v1/users/{encode_external_id(user.external_id)}",
+                headers={"If-None-Match": etag},
+            )
+
+            self.assertEqual(HTTPStatus.NOT_MODIFIED, response.status_code)
+            self.assertEqual(etag, response.headers["ETag"])
+            self.assertEqual(b"", response.content)
+
+    async def test_update_by_id_if_match(self) -> None:
+        update_user_request_body = {"firstName": "updated"}
+        async with generate_async_engine():
+            async with _async_session_maker() as session:
+                user = await save_user(session)
+
+            response = client.patch(
+                f"/v1/users/{encode_external_id(user.external_id)}",
+                json=update_user_request_body,
+                headers={"If-Match": '"1"'},
+            )
+            self.assertEqual(HTTPStatus.NO_CONTENT, response.status_code)
+
+            response = client.patch(
+                f"/v1/users/{encode_external_id(user.external_id)}",
+                json=update_user_request_body,
+                headers={"If-Match": '"1"'},
+            )
+            self.assertEqual(HTTPStatus.PRECONDITION_FAILED, response.status_code)
+
+            async with _async_session_maker() as session:
+                updated_user = await session.scalar(
+                    select(User).where(User.external_id == user.external_id)
+                )
+
+            if updated_user is None:
+                self.assertIsNotNone(updated_user)
+            else:
+                self.assertEqual(2, updated_user.version)
+                self.assertEqual("updated", updated_user.first_name)
+                self.assertEqual(user.last_name, updated_user.last_name)
+
+    async def test_update_by_id_not_found(self) -> None:
+        async with generate_async_engine():
+            response = client.patch("/v1/users/123", json={"firstName": "updated"})
+            self.assertEqual(HTTPStatus.NOT_FOUND, response.status_code)
+
+    async def test_update_by_id_if_match_not_found(self) -> None:
+        async with generate_async_engine():
+            missing_user_response = client.patch(
+                f"/v1/users/{encode_external_id(generate_external_id())}",
+                json={"firstName": "updated"},
+                headers={"If-Match": '"1"'},
+            )
+            invalid_id_response = client.patch(
+                "/v1/users/123",
+                json={"firstName": "updated"},
+                headers={"If-Match": '"1"'},
+            )
+
+        self.assertEqual(
+            HTTPStatus.PRECONDITION_FAILED, missing_user_response.status_code
+        )
+        self.assertEqual(
+            HTTPStatus.PRECONDITION_FAILED, invalid_id_response.status_code
+        )
+
+    async def test_delete_by_id_if_match_not_found(self) -> None:
+        async with generate_async_engine():
+            missing_user_response = client.delete(
+                f"/v1/users/{encode_external_id(generate_external_id())}",
+                headers={"If-Match": '"1"'},
+            )
+            invalid_id_response = client.delete(
+                "/v1/users/123", headers={"If-Match": '"1"'}
+            )
+            unconditional_response = client.delete(
+                f"/v1/users/{encode_external_id(generate_external_id())}"
+            )
+
+        self.assertEqual(
+            HTTPStatus.PRECONDITION_FAILED, missing_user_response.status_code
+        )
+        self.assertEqual(
+            HTTPStatus.PRECONDITION_FAILED, invalid_id_response.status_code
+        )
+        self.assertEqual(HTTPStatus.NO_CONTENT, unconditional_response.status_code)
+
+    async def test_delete_by_id_if_match_mismatch(self) -> None:
+        async with generate_async_engine():
+            async with _async_session_maker() as session:
+                user = await save_user(session)
+
+            response = client.delete(
+                f"/v1/users/{encode_external_id(user.external_id)}",
+                headers={"If-Match": '"2"'},
+            )
+
+            self.assertEqual(HTTPStatus.PRECONDITION_FAILED, response.status_code)
+
+            async with _async_session_maker() as session:
+                not_deleted_user = await session.scalar(
+                    select(User).where(User.external_id == user.external_id)
+                )
+
+            self.assertIsNotNone(not_deleted_user)
@@ -0,0 +1,78 @@
+import asyncio
+import datetime
+import unittest
+from typing import Any
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from simplecrud.database import user_insert_batcher
+from simplecrud.database.model import User
+from simplecrud.database.user_insert_batcher import UserInsertBatcher
+from simplecrud.util.id_util import generate_external_id
+from tests import test_user_crud
+from tests.test_user_crud import generate_async_engine
+
+
+def user_row(external_id: bytes, first_name: str | None = "first") -> dict[str, Any]:
+    return {
+        "external_id": external_id,
+        "first_name": first_name,
+        "last_name": "last",
+        "birthday": datetime.datetime.utcnow(),
+    }
+
+
+def batch_size_histogram_count() -> Any:
+    return user_insert_batcher._batch_size_histogram.get({})["count"]
+
+
+class TestUserInsertBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_insert_flushes_when_batch_is_full(self) -> None:
+        async with generate_async_engine():
+            batcher = UserInsertBatcher(
+                [test_user_crud._async_session_maker], max_size=3, max_wait_ms=10_000
+            )
+
+            await asyncio.wait_for(
+                asyncio.gather(
+                    *[
+                        batcher.insert(user_row(generate_external_id()))
+                        for _ in range(3)
+                    ]
+                ),
+                timeout=1,
+            )
+
+            async with test_user_crud._async_session_maker() as session:
+                users_count = await session.scalar(select(func.count(User.id)))
+
+            self.assertEqual(3, users_count)
+
+    async def test_insert_isolates_failed_row(self) -> None:
+        async with generate_async_engine():
+            batcher = UserInsertBatcher(
+                [test_user_crud._async_session_maker], max_size=10, max_wait_ms=5
+            )
+
+            external_ids = [generate_external_id() for _ in range(3)]
+            observed_batches = batch_size_histogram_count()
+            results = await asyncio.gather(
+                batcher.insert(user_row(external_ids[0])),
+                batcher.insert(user_row(external_ids[1], first_name=None)),
+                batcher.insert(user_row(external_ids[2])),
+                return_exceptions=True,
+            )
+
+            self.assertIsNone(results[0])
+            self.assertIsInstance(results[1], IntegrityError)
+            self.assertIsNone(results[2])
+            # retries of the failed batch are not observed as batches
+            self.assertEqual(observed_batches + 1, batch_size_histogram_count())
+
+            async with test_user_crud._async_session_maker() as session:
+                saved_ids = await session.scalars(
+                    select(User.external_id).order_by(User.external_id)
+                )
+
+            self.assertEqual([external_ids[0], external_ids[2]], list(saved_ids))
@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import unittest
+from typing import Any, cast
+
+from fastapi.testclient import TestClient
+from sqlalchemy import Table, create_mock_engine, delete, event, insert
+from sqlalchemy.schema import CreateTable
+
+from main import app
+from simplecrud.database.model import UserStat
+from simplecrud.database.sharding import get_shard_sessions
+from simplecrud.database.user_insert_batcher import UserInsertBatcher
+from simplecrud.stats.stats_reconciler import reconcile_shard
+from simplecrud.stats.user_stats import BIRTH_YEAR
+from simplecrud.util.id_util import generate_external_id
+from tests import test_user_crud
+from tests.test_user_crud import generate_async_engine, override_get_shard_sessions
+
+client = TestClient(app=app)
+
+
+def save_user(last_name: str, birthday: str) -> str:
+    user_id: str = client.post(
+        "/v1/users",
+        json={"firstName": "first", "lastName": last_name, "birthday": birthday},
+    ).json()["id"]
+    return user_id
+
+
+def get_user_stats() -> Any:
+    return client.get("/v1/user-stats").json()
+
+
+class TestUserStats(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        app.dependency_overrides[get_shard_sessions] = override_get_shard_sessions
+
+    async def test_stats_follow_user_changes(self) -> None:
+        async with generate_async_engine():
+            smith_id = save_user("smith", "1990-05-01T00:00:00")
+            save_user("Stone", "1990-07-01T00:00:00")
+            jones_id = save_user("Jones", "1985-01-01T00:00:00")
+            client.patch(
+                f"/v1/users/{smith_id}",
+                json={"lastName": "Brown", "birthday": "1991-01-01T00:00:00"},
+            )
+            client.patch(f"/v1/users/{smith_id}", json={"firstName": "renamed"})
+            client.delete(f"/v1/users/{jones_id}")
+            client.delete(f"/v1/users/{jones_id}")
+
+            user_stats = get_user_stats()
+
+        self.assertEqual({"1990": 1, "1991": 1}, user_stats["birthYears"])
+        self.assertEqual({"B": 1, "S": 1}, user_stats["lastNameInitials"])
+
+    async def test_batched_inserts_are_counted(self) -> None:
+        async with generate_async_engine():
+            batcher = UserInsertBatcher(
+                [test_user_crud._async_session_maker], max_size=2, max_wait_ms=10_000
+            )
+            await asyncio.gather(
+                *[
+                    batcher.insert(
+                        {
+                            "external_id": generate_external_id(),
+                            "first_name": "first",
+                            "last_name": last_name,
+                            "birthday": datetime.datetime(2000, 1, 1),
+                        }
+                    )
+                    for last_name in ["Adams", "Allen"]
+                ]
+            )
+            await batcher.close()
+
+            user_stats = get_user_stats()
+
+        self.assertEqual({"2000": 2}, user_stats["birthYears"])
+        self.assertEqual({"A": 2}, user_stats["lastNameInitials"])
+
+    async def test_reconcile_corrects_drift(self) -> None:
+        async with generate_async_engine():
+            save_user("smith", "1990-05-01T00:00:00")
+            save_user("Jones", "1985-01-01T00:00:00")
+            expected_stats = get_user_stats()
+
+            async with test_user_crud._async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(
+                        delete(UserStat).where(UserStat.bucket_type == BIRTH_YEAR)
+                    )
+                    await session.execute(
+                        insert(UserStat).values(
+                            bucket_type=BIRTH_YEAR, bucket="1970", slot=3, user_count=5
+                        )
+                    )
+
+            corrected_count = await reconcile_shard(test_user_crud._async_session_maker)
+            second_corrected_count = await reconcile_shard(
+                test_user_crud._async_session_maker
+            )
+
+            user_stats = get_user_stats()
+
+        self.assertEqual(3, corrected_count)
+        self.assertEqual(0, second_corrected_count)
+        self.assertEqual(expected_stats, user_stats)
+
+    async def test_recently_reconciled_shard_is_skipped(self) -> None:
+        async with generate_async_engine():
+            save_user("smith", "1990-05-01T00:00:00")
+            await reconcile_shard(test_user_crud._async_session_maker)
+            async with test_user_crud._async_session_maker() as session:
+                async with session.begin():
+                    await session.execute(delete(UserStat))
+
+            skipped_count = await reconcile_shard(
+                test_user_crud._async_session_maker, min_interval_seconds=3_600
+            )
+            skipped_stats = get_user_stats()
+            corrected_count = await reconcile_shard(test_user_crud._async_session_maker)
+
+        self.assertEqual(0, skipped_count)
+        self.assertEqual({}, skipped_stats["birthYears"])
+        self.assertEqual(2, corrected_count)
+
+    async def test_reconcile_lock_is_taken_before_counting(self) -> None:
+        async with generate_async_engine():
+            statements: list[str] = []
+
+            def record_statement(
+                _connection: Any, _cursor: Any, statement: str, *_: Any
+            ) -> None:
+                statements.append(statement.upper())
+
+            event.listen(
+                test_user_crud._override_engine.sync_engine,
+                "before_cursor_execute",
+                record_statement,
+            )
+            await reconcile_shard(test_user_crud._async_session_maker)
+
+        lock_index = next(
+            i
+            for i, statement in enumerate(statements)
+            if statement.startswith("SELECT")
+            and "FROM USER_STAT_RECONCILE" in statement
+        )
+        count_index = next(
+            i for i, statement in enumerate(statements) if "GROUP BY" in statement
+        )
+        self.assertLess(lock_index, count_index)
+
+    async def test_initials_differing_in_accent_are_separate_buckets(self) -> None:
+        async with generate_async_engine():
+            save_user("émile", "1990-05-01T00:00:00")
+            save_user("Édith", "1990-05-01T00:00:00")
+            save_user("Eve", "1990-05-01T00:00:00")
+
+            corrected_count = await reconcile_shard(test_user_crud._async_session_maker)
+            user_stats = get_user_stats()
+
+        self.assertEqual(0, corrected_count)
+        self.assertEqual({"E": 1, "É": 2}, user_stats["lastNameInitials"])
+
+    def test_bucket_is_binary_on_mysql(self) -> None:
+        mysql_engine = create_mock_engine("mysql://", executor=lambda *_: None)
+        create_table = str(
+            CreateTable(cast(Table, UserStat.__table__)).compile(
+                dialect=mysql_engine.dialect
+            )
+        )
+
+        self.assertIn("bucket VARCHAR(10) COLLATE utf8mb4_bin", create_table)